@@ -1,5 +1,15 @@
+"""Kinetic models and the (batched) estimators of their parameters used by `ss_estimation` and `Velocity`.
+
+The numba kernels in this module and in `velocity.py` are compiled on their first call in every session. Caching the
+compiled code on disk is opt-in, by setting the environment variable DYNAMO_NUMBA_CACHE=1 before dynamo is imported,
+since writing the cache can fail with numba's error_write issue (the reason it is also disabled in
+`vectorfield/utils.py`). Without it, the few seconds of compilation on the first fit and velocity call are accepted.
+"""
+import os
+
 import numpy as np
 import statsmodels.api as sm
+from numba import jit, prange
 from scipy.optimize import least_squares
 from scipy.sparse import csr_matrix, issparse
 from sklearn.linear_model import LinearRegression, RANSACRegressor
@@ -7,6 +17,9 @@ from sklearn.linear_model import LinearRegression, RANSACRegressor
 from ...tools.moments import strat_mom
 from ...tools.utils import elem_prod, find_extreme
 
+# whether numba caches the compiled kernels on disk, off unless DYNAMO_NUMBA_CACHE is set (see the module docstring)
+_NUMBA_CACHE = os.environ.get("DYNAMO_NUMBA_CACHE", "0").lower() in ("1", "true")
+
 
 def sol_u(t, u0, alpha, beta):
     """The analytical solution of unspliced mRNA kinetics.
@@ -160,6 +173,23 @@ def solve_gamma(t, old, total):
     return gamma
 
 
+def row_means(X):
+    """The mean of each row of a dense or sparse matrix, as a flat vector."""
+    return np.asarray(X.mean(1)).ravel()
+
+
+def solve_gamma_mean(t, old, total):
+    """`solve_gamma` from the mean old and total RNA of each gene. As the mean is linear, the mean total RNA can be
+    summed up from the `row_means` of the layers that make it up, without forming the total RNA matrix.
+
+    Returns
+    -------
+    Returns the degradation rate (gamma) of each gene.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return -1 / t * np.log(old / total)
+
+
 def solve_alpha_2p(t0, t1, alpha0, beta, u1):
     """Given known steady state alpha and beta, solve stimulation alpha for a mixed steady state and stimulation labeling experiment.
 
@@ -193,6 +223,39 @@ def solve_alpha_2p(t0, t1, alpha0, beta, u1):
     return alpha1
 
 
+@jit(nopython=True, parallel=True, error_model="numpy", cache=_NUMBA_CACHE)
+def solve_alpha_2p_batch(t0, t1, alpha0, beta, u1):
+    """`solve_alpha_2p` for all genes and stimulation time points, with the genes distributed over threads.
+
+    Parameters
+    ----------
+    t0: :class:`~numpy.ndarray`
+        Time period for steady state labeling of each time point.
+    t1: :class:`~numpy.ndarray`
+        Time period for stimulation labeling of each time point.
+    alpha0: :class:`~numpy.ndarray`
+        steady state transcription rate calculated from one-shot experiment mode for each gene.
+    beta: :class:`~numpy.ndarray`
+        steady state (and simulation) splicing rate calculated from one-shot experiment mode for each gene.
+    u1: :class:`~numpy.ndarray`
+        The mean labeled RNA amount of each gene (row) observed at each time point (column) t0 + t1.
+
+    Returns
+    -------
+    alpha1: :class:`~numpy.ndarray`
+        The transcription rate for the stimulation period of each gene and time point.
+    """
+    n_genes, n_t = u1.shape
+    alpha1 = np.zeros((n_genes, n_t))
+    for i in prange(n_genes):
+        for j in range(n_t):
+            if t0[j] != 0:
+                u0 = alpha0[i] / beta[i] * (1 - np.exp(-beta[i] * t0[j]))
+                alpha1[i, j] = beta[i] * (u1[i, j] - u0 * np.exp(-beta[i] * t1[j])) / (1 - np.exp(-beta[i] * t1[j]))
+
+    return alpha1
+
+
 def solve_alpha_2p_mat(t0, t1, alpha0, beta, u1):
     """Given known steady state alpha and beta, solve stimulation alpha for a mixed steady state and stimulation
     labeling experiment in a matrix form.
@@ -297,6 +360,184 @@ def fit_linreg(x, y, mask=None, intercept=False, r2=True):
         return k, b
 
 
+def fit_linreg_batch(x, y, mask=None, intercept=False, r2=True):
+    """Row-wise simple linear regression: y[i] = k[i] * x[i] + b[i], solved for all rows at once.
+
+    Arguments
+    ---------
+    x: :class:`~numpy.ndarray`
+        A matrix of independent variables. Dimension: genes x cells.
+    y: :class:`~numpy.ndarray`
+        A matrix of dependent variables. Dimension: genes x cells.
+    mask: :class:`~numpy.ndarray` or None
+        A boolean matrix that selects the data points used in the regression of each row.
+    intercept: bool
+        If using steady state assumption for fitting, then:
+        True -- the linear regression is performed with an unfixed intercept;
+        False -- the linear regresssion is performed with a fixed zero intercept
+
+    Returns
+    -------
+    k: :class:`~numpy.ndarray`
+        The estimated slope of each row.
+    b: :class:`~numpy.ndarray`
+        The estimated intercept of each row.
+    r2: :class:`~numpy.ndarray`
+        Coefficient of determination or r square calculated with the extreme data points of each row.
+    all_r2: :class:`~numpy.ndarray`
+        The r2 calculated using all data points of each row.
+    """
+    _mask = np.logical_and(~np.isnan(x), ~np.isnan(y))
+    if mask is not None:
+        _mask &= mask
+    n = _mask.sum(1)
+    xx, yy = np.where(_mask, x, 0), np.where(_mask, y, 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xm, ym = xx.sum(1) / n, yy.sum(1) / n
+        if intercept:
+            cov = (xx * yy).sum(1) / n - xm * ym
+            var_x = (xx * xx).sum(1) / n - xm * xm
+            k = cov / var_x
+            b = ym - k * xm
+        else:
+            # use uncentered cov and var_x
+            cov = (xx * yy).sum(1) / n
+            var_x = (xx * xx).sum(1) / n
+            k = cov / var_x
+            b = np.zeros_like(k)
+
+        if r2:
+            res = y - k[:, None] * x - b[:, None]
+            dev, mask_res = np.where(_mask, y - ym[:, None], 0), np.where(_mask, res, 0)
+            SS_tot_n, all_SS_tot_n = (dev * dev).sum(1) / n, np.var(y, axis=1)
+            SS_res_n, all_SS_res_n = (mask_res * mask_res).sum(1) / n, np.mean(res**2, axis=1)
+            r2, all_r2 = 1 - SS_res_n / SS_tot_n, 1 - all_SS_res_n / all_SS_tot_n
+
+            return k, b, r2, all_r2
+        else:
+            return k, b
+
+
+@jit(nopython=True, cache=_NUMBA_CACHE)
+def _select_percentile(a, q):
+    """The q-th percentile of the nan-free vector a, interpolated the same way as `np.percentile` (method "linear"),
+    found with a quickselect in O(n) instead of a full sort. a is partially reordered in place instead of copied, so
+    that several percentiles can be selected from one scratch array."""
+    idx = q / 100 * (len(a) - 1)
+    k = int(np.floor(idx))
+    lo, hi = 0, len(a) - 1
+    while lo < hi:
+        pivot = a[(lo + hi) // 2]
+        i, j = lo, hi
+        while i <= j:
+            while a[i] < pivot:
+                i += 1
+            while a[j] > pivot:
+                j -= 1
+            if i <= j:
+                a[i], a[j] = a[j], a[i]
+                i += 1
+                j -= 1
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            break
+    # the elements after position k are all at least a[k], so the next order statistic is their minimum
+    x_lo = a[k]
+    x_hi = np.min(a[k + 1 :]) if k + 1 < len(a) else x_lo
+    t, d = idx - k, x_hi - x_lo
+    return x_hi - d * (1 - t) if t >= 0.5 else x_lo + d * t
+
+
+@jit(nopython=True, error_model="numpy", cache=_NUMBA_CACHE)
+def steady_state_linreg(s, u, perc_left=-1.0, perc_right=5.0, normalize=True, intercept=False):
+    """Compiled single-pass version of `find_extreme` followed by `fit_linreg(s, u, mask, intercept)` and the masked and
+    all-data `calc_norm_loglikelihood` of the steady state model u = k * s + b, for dense vectors of one gene.
+
+    A negative `perc_left` or `perc_right` stands for None.
+
+    Returns
+    -------
+    k, b, r2, all_r2, logLL, all_logLL: float
+        The same statistics as returned by `ss_estimation.fit_gamma_steady_state`.
+    """
+    n = len(s)
+    su = np.empty(n)
+    if normalize:
+        s_max, u_max = max(np.max(s), 1e-3), max(np.max(u), 1e-3)
+        for j in range(n):
+            su[j] = s[j] / s_max + u[j] / u_max
+    else:
+        su[:] = s + u
+
+    # the extreme data points are those with su at or beyond the thresholds, which are tested inline instead of being
+    # stored in a mask; both thresholds are selected from one scratch copy of su and a nan threshold selects nothing
+    all_in, left, right = perc_right < 0, np.nan, np.nan
+    if not all_in and not np.isnan(su).any():
+        scratch = su.copy()
+        right = _select_percentile(scratch, 100 - perc_right)
+        if perc_left >= 0:
+            left = _select_percentile(scratch, perc_left)
+
+    # first pass: the sums of the (non-nan) extreme data points for the regression
+    m, sx, sy, sxx, sxy = 0, 0.0, 0.0, 0.0, 0.0
+    for j in range(n):
+        if (all_in or su[j] >= right or su[j] <= left) and not (np.isnan(s[j]) or np.isnan(u[j])):
+            m += 1
+            sx += s[j]
+            sy += u[j]
+            sxx += s[j] * s[j]
+            sxy += s[j] * u[j]
+    xm, ym = sx / m, sy / m
+    if intercept:
+        k = (sxy / m - xm * ym) / (sxx / m - xm * xm)
+        b = ym - k * xm
+    else:
+        # use uncentered cov and var_x
+        k = sxy / sxx
+        b = 0.0
+
+    # second pass: residuals for r2 and the log likelihood
+    all_ym = np.mean(u)
+    n_ext, ss_tot, ss_res, sig2 = 0, 0.0, 0.0, 0.0
+    all_ss_tot, all_ss_res, all_sig2 = 0.0, 0.0, 0.0
+    for j in range(n):
+        res, d = u[j] - k * s[j] - b, k * s[j] - u[j]
+        all_ss_tot += (u[j] - all_ym) ** 2
+        all_ss_res += res * res
+        all_sig2 += d * d
+        if all_in or su[j] >= right or su[j] <= left:
+            n_ext += 1
+            sig2 += d * d
+            if not (np.isnan(s[j]) or np.isnan(u[j])):
+                ss_tot += (u[j] - ym) ** 2
+                ss_res += res * res
+
+    r2, all_r2 = 1 - ss_res / ss_tot, 1 - all_ss_res / all_ss_tot
+    logLL = -n_ext / 2 * np.log(2 * np.pi) - 0.5 * n_ext * np.log(sig2) - 0.5 * sig2 / sig2
+    all_logLL = -n / 2 * np.log(2 * np.pi) - 0.5 * n * np.log(all_sig2) - 0.5 * all_sig2 / all_sig2
+
+    return k, b, r2, all_r2, logLL, all_logLL
+
+
+@jit(nopython=True, parallel=True, error_model="numpy", cache=_NUMBA_CACHE)
+def steady_state_linreg_batch(S, U, perc_left=-1.0, perc_right=5.0, normalize=True, intercept=False):
+    """`steady_state_linreg` for each row of dense genes x cells matrices, with the genes distributed over threads.
+
+    Returns
+    -------
+    res: :class:`~numpy.ndarray`
+        A 6 x genes matrix of k, b, r2, all_r2, logLL and all_logLL.
+    """
+    res = np.empty((6, S.shape[0]))
+    for i in prange(S.shape[0]):
+        res[:, i] = np.array(steady_state_linreg(S[i], U[i], perc_left, perc_right, normalize, intercept))
+    return res
+
+
 def fit_linreg_robust(x, y, mask=None, intercept=False, r2=True, est_method="rlm"):
     """Apply robust linear regression of y w.r.t x.
 
@@ -431,6 +672,55 @@ def fit_stochastic_linreg(u, s, us, ss, fit_2_gammas=True, err_cov=False):
     return gamma
 
 
+def fit_stochastic_linreg_batch(u, s, us, ss, mask=None):
+    """Row-wise generalized method of moments: [u, 2*us + u] = gamma * [s, 2*ss - s], solved for all rows at once.
+
+    This is the vectorized version of `fit_stochastic_linreg` with two gammas and a diagonal error covariance matrix.
+
+    Arguments
+    ---------
+    u: :class:`~numpy.ndarray`
+        A matrix of first moments (mean) of unspliced (or new) RNA expression. Dimension: genes x cells.
+    s: :class:`~numpy.ndarray`
+        A matrix of first moments (mean) of spliced (or total) RNA expression. Dimension: genes x cells.
+    us: :class:`~numpy.ndarray`
+        A matrix of second moments (uncentered co-variance) of unspliced/spliced (or new/total) RNA expression.
+    ss: :class:`~numpy.ndarray`
+        A matrix of second moments (uncentered variance) of spliced (or total) RNA expression.
+    mask: :class:`~numpy.ndarray` or None
+        A boolean matrix that selects the data points used for each row.
+
+    Returns
+    -------
+    gamma: :class:`~numpy.ndarray`
+        The estimated gamma of each row.
+    """
+    mask = np.ones(u.shape, dtype=bool) if mask is None else mask
+    y0, y1 = u, u + 2 * us
+    x0, x1 = s, 2 * ss - s
+
+    k0 = fit_linreg_batch(x0, y0, mask, r2=False)[0]
+    k1 = fit_linreg_batch(x1, y1, mask, r2=False)[0]
+    n = mask.sum(1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = np.zeros((2, u.shape[0]))
+        for i, (x, y, k) in enumerate(((x0, y0, k0), (x1, y1, k1))):
+            E = y - k[:, None] * x
+            E_m = np.where(mask, E, 0).sum(1) / n
+            E_d = np.where(mask, E - E_m[:, None], 0)
+            var[i] = (E_d * E_d).sum(1) / n
+        # pseudo-inverse of the diagonal error covariance, with the same cutoff as `np.linalg.pinv`
+        cov_inv = np.where(var > 1e-15 * var.max(0), 1 / var, 0)
+
+        # generalized least squares
+        xy = cov_inv[0] * np.where(mask, y0 * x0, 0).sum(1) + cov_inv[1] * np.where(mask, y1 * x1, 0).sum(1)
+        xx = cov_inv[0] * np.where(mask, x0 * x0, 0).sum(1) + cov_inv[1] * np.where(mask, x1 * x1, 0).sum(1)
+        gamma = np.where(xx == 0, np.nan, xy / xx)
+
+    return gamma
+
+
 def fit_first_order_deg_lsq(t, l, bounds=(0, np.inf), fix_l0=False, beta_0=1):
     """Estimate beta with degradation data using least squares method.
 
@@ -472,6 +762,197 @@ def fit_first_order_deg_lsq(t, l, bounds=(0, np.inf), fix_l0=False, beta_0=1):
     return beta, l0
 
 
+def fit_first_order_deg_lsq_batch(t, L, beta_0=1):
+    """Estimate beta with degradation data using least squares method for all genes at once.
+
+    All genes are stacked into a single least squares problem whose Jacobian is block diagonal, so that one call of
+    `least_squares` replaces one call per gene. The residuals of each gene are scaled by its mean expression, which
+    does not change the per-gene optimum but keeps the convergence criteria balanced across genes.
+
+    Arguments
+    ---------
+    t: :class:`~numpy.ndarray`
+        A vector of time points.
+    L: :class:`~numpy.ndarray` or sparse `csr_matrix`
+        A matrix of unspliced, labeled mRNA counts for each time point. Dimension: genes x time points.
+    beta_0: float
+        Initial guess for beta.
+
+    Returns
+    -------
+    beta: :class:`~numpy.ndarray`
+        The estimated value for beta of each gene. Genes with non-finite data are set to `np.nan`.
+    l0: :class:`~numpy.ndarray`
+        The estimated value for the initial spliced, labeled mRNA count of each gene.
+    """
+    L = L.A if issparse(L) else np.asarray(L, dtype=float)
+    n_genes, n_t = L.shape
+
+    tau = np.asarray(t - np.min(t), dtype=float)
+    with np.errstate(invalid="ignore"):
+        l0 = np.nanmean(L[:, tau == 0], 1)
+
+    beta, l0_ = np.full(n_genes, np.nan), np.full(n_genes, np.nan)
+    valid = np.isfinite(L).all(1) & np.isfinite(l0) & (l0 >= 0)
+    if valid.any():
+        beta[valid], l0_[valid] = least_squares_batch(
+            lambda p: first_order_deg_model(tau, p[0], p[1]),
+            L[valid],
+            np.vstack((np.full(valid.sum(), beta_0, dtype=float), l0[valid])),
+        )
+
+    return beta, l0_
+
+
+def fit_gamma_lsq_batch(t, S, beta, u0):
+    """Estimate gamma with degradation data using least squares method for all genes at once. This is the vectorized
+    version of `fit_gamma_lsq`.
+
+    Arguments
+    ---------
+    t: :class:`~numpy.ndarray`
+        A vector of time points.
+    S: :class:`~numpy.ndarray` or sparse `csr_matrix`
+        A matrix of spliced, labeled mRNA counts for each time point. Dimension: genes x time points.
+    beta: :class:`~numpy.ndarray`
+        A vector of betas for all the genes.
+    u0: :class:`~numpy.ndarray`
+        A vector of the initial number of unspliced mRNA of each gene.
+
+    Returns
+    -------
+    gamma: :class:`~numpy.ndarray`
+        The estimated value for gamma of each gene. Genes without a valid initial guess are set to `np.nan`.
+    s0: :class:`~numpy.ndarray`
+        The estimated value for the initial spliced mRNA count of each gene.
+    """
+    S = S.A if issparse(S) else np.asarray(S, dtype=float)
+    beta, u0 = np.asarray(beta, dtype=float), np.asarray(u0, dtype=float)
+
+    tau = np.asarray(t - np.min(t), dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s0 = np.mean(S[:, tau == 0], 1)
+        g0 = beta * u0 / s0
+
+    gamma, s0_ = np.full(S.shape[0], np.nan), np.zeros(S.shape[0])
+    valid = np.isfinite(g0) & np.isfinite(S).all(1) & np.isfinite(beta)
+    if valid.any():
+        b, u = beta[valid], u0[valid]
+        gamma[valid], s0_[valid] = least_squares_batch(
+            lambda p: spliced_deg_model(tau, p[0], p[1], b, u), S[valid], np.vstack((g0[valid], s0[valid]))
+        )
+
+    return gamma, s0_
+
+
+@jit(nopython=True, parallel=True, cache=_NUMBA_CACHE)
+def first_order_deg_model(tau, beta, l0):
+    """The first order degradation l0 * exp(-beta * tau) of each gene, with the genes distributed over threads.
+
+    Returns
+    -------
+    l: :class:`~numpy.ndarray`
+        The predicted counts. Dimension: genes x time points.
+    jac: :class:`~numpy.ndarray`
+        The derivatives of the predictions with respect to beta and l0. Dimension: 2 x genes x time points.
+    """
+    l, jac = np.empty((len(beta), len(tau))), np.empty((2, len(beta), len(tau)))
+    for i in prange(len(beta)):
+        for j in range(len(tau)):
+            exp_bt = np.exp(-beta[i] * tau[j])
+            l[i, j] = l0[i] * exp_bt
+            jac[0, i, j] = -tau[j] * l0[i] * exp_bt
+            jac[1, i, j] = exp_bt
+    return l, jac
+
+
+@jit(nopython=True, parallel=True, error_model="numpy", cache=_NUMBA_CACHE)
+def spliced_deg_model(tau, gamma, s0, beta, u0):
+    """The degradation of spliced mRNA produced from unspliced mRNA that is degraded with beta, the same model as in
+    `fit_gamma_lsq`, for each gene with the genes distributed over threads.
+
+    Returns
+    -------
+    s: :class:`~numpy.ndarray`
+        The predicted counts. Dimension: genes x time points.
+    jac: :class:`~numpy.ndarray`
+        The derivatives of the predictions with respect to gamma and s0. Dimension: 2 x genes x time points.
+    """
+    s, jac = np.empty((len(gamma), len(tau))), np.empty((2, len(gamma), len(tau)))
+    for i in prange(len(gamma)):
+        g, b, u = gamma[i], beta[i], u0[i]
+        for j in range(len(tau)):
+            exp_gt, exp_bt = np.exp(-g * tau[j]), np.exp(-b * tau[j])
+            if b == g:
+                s[i, j] = s0[i] * exp_gt + b * u * tau[j] * exp_gt
+                jac[0, i, j] = -tau[j] * s0[i] * exp_gt - b * u * tau[j] * tau[j] * exp_gt / 2
+            else:
+                s[i, j] = s0[i] * exp_gt - u * b / (g - b) * (exp_gt - exp_bt)
+                jac[0, i, j] = (
+                    -tau[j] * s0[i] * exp_gt
+                    + u * b * tau[j] * exp_gt / (g - b)
+                    + u * b * (exp_gt - exp_bt) / (g - b) ** 2
+                )
+            jac[1, i, j] = exp_gt
+    return s, jac
+
+
+def least_squares_batch(model, X, p0, bounds=(0, np.inf)):
+    """Fit a per-gene model to each row of `X` with a single call of `least_squares`.
+
+    All genes are stacked into one problem whose Jacobian is block diagonal, so that one call of `least_squares`
+    replaces one call per gene. The residuals of each gene are scaled by its mean absolute value, which does not change
+    the per-gene optimum but keeps the convergence criteria balanced across genes.
+
+    Arguments
+    ---------
+    model: `function`
+        A function mapping the n_params x n_genes matrix of parameters to the n_genes x n_t model predictions and their
+        n_params x n_genes x n_t derivatives with respect to the parameters.
+    X: :class:`~numpy.ndarray`
+        The data to be fitted. Dimension: genes x time points.
+    p0: :class:`~numpy.ndarray`
+        The initial guess of the parameters. Dimension: n_params x n_genes.
+    bounds: tuple
+        The bounds for all the parameters.
+
+    Returns
+    -------
+    p: :class:`~numpy.ndarray`
+        The estimated parameters. Dimension: n_params x n_genes.
+    """
+    (n_genes, n_t), n_params = X.shape, p0.shape[0]
+    scale = np.mean(np.abs(X), 1)
+    scale[scale == 0] = 1
+
+    # the residuals are ordered gene by gene (`n_t` residuals per gene) and the parameters are ordered parameter by
+    # parameter (`n_genes` values of the first parameter, then of the second one, etc.), so each row of the Jacobian
+    # has the `n_params` entries of its own gene
+    indptr = np.arange(0, n_genes * n_t * n_params + 1, n_params)
+    indices = (np.repeat(np.arange(n_genes), n_t)[:, None] + n_genes * np.arange(n_params)[None, :]).ravel()
+    last = {}
+
+    def evaluate(p):
+        # `least_squares` evaluates the Jacobian at the point of the last residuals, so both are computed together
+        if "p" not in last or not np.array_equal(last["p"], p):
+            last["p"], last["res"] = p.copy(), model(np.ascontiguousarray(p.reshape(n_params, n_genes)))
+        return last["res"]
+
+    def jac(p):
+        data = (evaluate(p)[1] / scale[None, :, None]).transpose(1, 2, 0).ravel()
+        return csr_matrix((data, indices, indptr), shape=(n_genes * n_t, n_genes * n_params))
+
+    ret = least_squares(
+        lambda p: ((evaluate(p)[0] - X) / scale[:, None]).ravel(),
+        p0.ravel(),
+        jac=jac,
+        bounds=bounds,
+        x_scale="jac",
+    )
+
+    return ret.x.reshape(n_params, n_genes)
+
+
 def solve_first_order_deg(t, l):
     """Solve for the initial amount and the rate constant of a species (for example, labeled mRNA) with time-series data
     under first-order degration kinetics model.
@@ -581,6 +1062,34 @@ def fit_alpha_synthesis(t, u, beta):
     return beta * np.mean(u) / np.mean(x)
 
 
+def fit_alpha_synthesis_batch(t, U, beta):
+    """Estimate alpha with synthesis data for all genes at once. This is the vectorized version of
+    `fit_alpha_synthesis`.
+
+    Arguments
+    ---------
+    t: :class:`~numpy.ndarray`
+        A vector of time points.
+    U: :class:`~numpy.ndarray` or sparse `csr_matrix`
+        A matrix of unspliced mRNA counts. Dimension: genes x time points.
+    beta: :class:`~numpy.ndarray`
+        A vector of betas for all the genes.
+
+    Returns
+    -------
+    alpha: :class:`~numpy.ndarray`
+        The estimated value for alpha of each gene.
+    """
+    U = U.A if issparse(U) else np.asarray(U, dtype=float)
+    beta = np.asarray(beta, dtype=float).flatten()
+
+    # fit alpha assuming u=0 at t=0
+    x = 1 - np.exp(-beta[:, None] * np.asarray(t)[None, :])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return beta * np.mean(U, 1) / np.mean(x, 1)
+
+
 def fit_alpha_degradation(t, u, beta, intercept=False):
     """Estimate alpha with degradation data using linear regression. This is a lsq version of the following function that
     constrains u0 to be larger than 0
@@ -623,6 +1132,66 @@ def fit_alpha_degradation(t, u, beta, intercept=False):
     return alpha, u0, r2
 
 
+def fit_alpha_degradation_batch(t, U, beta, intercept=False):
+    """Estimate alpha with degradation data for all genes at once. This is the vectorized version of
+    `fit_alpha_degradation`.
+
+    With a known beta, the model is linear in its two non-negative parameters, so the bounded least squares problem of
+    each gene is solved in closed form: the unconstrained solution is used when it is feasible, otherwise the optimum
+    lies on one of the bounds.
+
+    Arguments
+    ---------
+    t: :class:`~numpy.ndarray`
+        A vector of time points.
+    U: :class:`~numpy.ndarray` or sparse `csr_matrix`
+        A matrix of unspliced mRNA counts. Dimension: genes x time points.
+    beta: :class:`~numpy.ndarray`
+        A vector of betas for all the genes.
+    intercept: bool
+        Not used, kept for consistency with `fit_alpha_degradation`.
+
+    Returns
+    -------
+    alpha: :class:`~numpy.ndarray`
+        The estimated value for alpha of each gene.
+    u0: :class:`~numpy.ndarray`
+        The initial unspliced mRNA count of each gene.
+    r2: :class:`~numpy.ndarray`
+        Coefficient of determination or r square of each gene.
+    """
+    x = U.A if issparse(U) else np.asarray(U, dtype=float)
+    beta = np.asarray(beta, dtype=float).reshape(-1, 1)
+
+    tau = t - np.min(t)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # the coefficients of the two parameters of `sol_u(tau, p[0], p[1], beta)`
+        a = np.exp(-beta * tau)
+        c = np.where(beta > 0, (1 - a) / beta, tau)
+        aa, ac, cc = (a * a).sum(1), (a * c).sum(1), (c * c).sum(1)
+        ax, cx = (a * x).sum(1), (c * x).sum(1)
+
+        det = aa * cc - ac * ac
+        candidates = [
+            ((cc * ax - ac * cx) / det, (aa * cx - ac * ax) / det),
+            (np.clip(ax / aa, 0, None), np.zeros_like(ax)),
+            (np.zeros_like(cx), np.clip(cx / cc, 0, None)),
+        ]
+        ssr = np.array([((p0[:, None] * a + p1[:, None] * c - x) ** 2).sum(1) for p0, p1 in candidates])
+        p = np.array(candidates)
+        feasible = np.isfinite(p).all(1) & (p >= 0).all(1)
+        ssr[~feasible] = np.inf
+        best = np.argmin(ssr, 0)
+        p0, p1 = p[best, 0, np.arange(len(best))], p[best, 1, np.arange(len(best))]
+
+        # calculate r-squared
+        SS_tot_n = np.var(x, 1)
+        SS_res_n = np.mean((p0[:, None] * a + p1[:, None] * c - x) ** 2, 1)
+        r2 = 1 - SS_res_n / SS_tot_n
+
+    return p0, p1, r2
+
+
 def solve_alpha_degradation(t, u, beta, intercept=False):
     """Estimate alpha with degradation data using linear regression.
 
@@ -748,6 +1317,86 @@ def fit_all_synthesis(t, l, bounds=(0, np.inf), alpha_0=1, beta_0=1, gamma_0=1):
     return ret.x[0], ret.x[1], ret.x[2]
 
 
+def _R2_loglikelihood(n, sx, sy, sxx, syy, sxy, k, b):
+    """Row-wise r square of y[i] = k[i] * x[i] + b[i] and log likelihood of y[i] = k[i] * x[i] from the sums of x, y
+    and their products over the n data points of each row."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # sum((k * x - y) ** 2) and sum((k * x + b - y) ** 2) expanded into the sums, clipped for rounding errors
+        sig2 = np.clip(k * k * sxx - 2 * k * sxy + syy, 0, None)
+        SS_res = sig2 + 2 * b * (k * sx - sy) + n * b * b
+        SS_tot = syy - sy * sy / n
+        r2 = 1 - SS_res / SS_tot
+        # the residuals are standardized by their own sum of squares, so that their squared norm is one
+        logLL = -n / 2 * np.log(2 * np.pi) - 0.5 * n * np.log(sig2) - 0.5 * sig2 / sig2
+
+    return r2, logLL
+
+
+def calc_R2_loglikelihood_batch(x, y, k, mask=None, b=None):
+    """Row-wise r square of y[i] = k[i] * x[i] + b[i] and log likelihood of y[i] = k[i] * x[i] based on normal
+    distribution; the vectorized version of `calc_R2` and `calc_norm_loglikelihood` for a single species. Both are
+    computed from one set of (masked) row sums and dot products instead of materializing the residuals.
+
+    Returns
+    -------
+    r2: :class:`~numpy.ndarray`
+        The r square of each row.
+    logLL: :class:`~numpy.ndarray`
+        The log likelihood of each row.
+    """
+    b = np.zeros(x.shape[0]) if b is None else b
+    if mask is None:
+        n = x.shape[1]
+    else:
+        n, x, y = mask.sum(1), np.where(mask, x, 0), np.where(mask, y, 0)
+    sxx, syy, sxy = np.einsum("ij,ij->i", x, x), np.einsum("ij,ij->i", y, y), np.einsum("ij,ij->i", x, y)
+
+    return _R2_loglikelihood(n, x.sum(1), y.sum(1), sxx, syy, sxy, k, b)
+
+
+def csr_row_sums(X):
+    """Sum the stored values of each row of a sparse matrix in a single pass over its data buffer."""
+    X = X.tocsr()
+    sums = np.zeros(X.shape[0])
+    # `np.add.reduceat` returns the value at the start index for empty segments, so only non-empty rows are reduced
+    non_empty = np.diff(X.indptr) > 0
+    if non_empty.any():
+        sums[non_empty] = np.add.reduceat(X.data, X.indptr[:-1][non_empty])
+    return sums
+
+
+def calc_sparse_R2_loglikelihood(x, y, k, b=None):
+    """Row-wise r square of y[i] = k[i] * x[i] + b[i] and log likelihood of y[i] = k[i] * x[i] over all the data points
+    of sparse matrices, computed from row sums of their stored values so that they are never densified.
+
+    Returns
+    -------
+    r2: :class:`~numpy.ndarray`
+        The r square of each row, the same as the `all_r2` returned by `fit_linreg` or `calc_R2`.
+    logLL: :class:`~numpy.ndarray`
+        The log likelihood of each row, the same as the one returned by `calc_norm_loglikelihood`.
+    """
+    x, y = csr_matrix(x), csr_matrix(y)
+    b = np.zeros(x.shape[0]) if b is None else b
+    sx, sy = csr_row_sums(x), csr_row_sums(y)
+    sxx, syy, sxy = csr_row_sums(x.multiply(x)), csr_row_sums(y.multiply(y)), csr_row_sums(x.multiply(y))
+
+    return _R2_loglikelihood(x.shape[1], sx, sy, sxx, syy, sxy, k, b)
+
+
+def get_row_blocks(n_rows, n_cols, max_elements=2**22):
+    """Split `n_rows` rows into contiguous (start, stop) blocks with at most `max_elements` entries each."""
+    step = max(1, max_elements // max(1, n_cols))
+    return [(start, min(start + step, n_rows)) for start in range(0, n_rows, step)]
+
+
+def dense_rows(X, start, stop):
+    """Get the rows `start:stop` of a dense or sparse matrix as a C-contiguous float array, so that the per-gene
+    kernels read each row from contiguous memory even if the matrix is column-major."""
+    X = X[start:stop]
+    return np.ascontiguousarray(X.toarray() if issparse(X) else X, dtype=float)
+
+
 def concat_time_series_matrices(mats, t=None):
     """Concatenate a list of gene x cell matrices into a single matrix.
 
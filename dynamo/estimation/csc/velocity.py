@@ -1,26 +1,119 @@
-import itertools
 from multiprocessing.dummy import Pool as ThreadPool
 from warnings import warn
 
+from numba import jit, prange
 from scipy.sparse import csr_matrix
 from tqdm import tqdm
 
 from ...tools.moments import calc_2nd_moment, calc_12_mom_labeling
 from ...tools.utils import (
     calc_norm_loglikelihood,
-    calc_R2,
+    find_extreme_batch,
+    group_by_time,
     one_shot_alpha,
     one_shot_alpha_matrix,
-    one_shot_gamma_alpha,
     one_shot_gamma_alpha_matrix,
     update_dict,
 )
 from .utils_velocity import *
+from .utils_velocity import _NUMBA_CACHE
 
 # from sklearn.cluster import KMeans
 # from sklearn.neighbors import NearestNeighbors
 
 
+@jit(nopython=True, parallel=True, cache=_NUMBA_CACHE)
+def _vel_u_kernel(alpha, beta, U, V):
+    """Fused `alpha - beta * U` for a dense genes x cells U, a per-gene beta and an alpha that is either genes x cells
+    or a genes x 1 column, written into V."""
+    n_genes, n_cells = U.shape
+    per_cell = alpha.shape[1] > 1
+    for i in prange(n_genes):
+        for j in range(n_cells):
+            V[i, j] = alpha[i, j if per_cell else 0] - beta[i] * U[i, j]
+    return V
+
+
+@jit(nopython=True, parallel=True, cache=_NUMBA_CACHE)
+def _vel_s_kernel(beta, gamma, U, S, V):
+    """Fused `beta * U - gamma * S` for dense genes x cells U and S and per-gene beta and gamma, written into V. Also
+    used for the protein velocity `eta * S - delta * P`."""
+    n_genes, n_cells = U.shape
+    for i in prange(n_genes):
+        for j in range(n_cells):
+            V[i, j] = beta[i] * U[i, j] - gamma[i] * S[i, j]
+    return V
+
+
+@jit(nopython=True, parallel=True, cache=_NUMBA_CACHE)
+def _csr_subtract_kernel(V, indptr, indices, data, k):
+    """Subtract `k[i] * X[i, j]` from the dense V at the stored entries of the csr matrix X, in place."""
+    for i in prange(V.shape[0]):
+        for p in range(indptr[i], indptr[i + 1]):
+            V[i, indices[p]] -= k[i] * data[p]
+    return V
+
+
+@jit(nopython=True, cache=_NUMBA_CACHE)
+def _affine_row(a, k, indptr, indices, data, i, row):
+    """Row i of `a - k * X` for a csr X into the dense buffer row, see `_csr_affine_kernel`."""
+    per_cell = a.shape[1] > 1
+    for j in range(row.shape[0]):
+        row[j] = a[i, j if per_cell else 0]
+    for p in range(indptr[i], indptr[i + 1]):
+        row[indices[p]] -= k[i] * data[p]
+    return row
+
+
+@jit(nopython=True, parallel=True, cache=_NUMBA_CACHE)
+def _csr_affine_kernel(a, k, indptr, indices, data, n_cols):
+    """`a - k * X` for a csr X, a per-gene k and an alpha that is either genes x cells or a genes x 1 column, built
+    directly as the indptr, indices and data of a csr matrix that stores the nonzero differences, without a dense genes
+    x cells intermediate."""
+    n_rows = len(indptr) - 1
+    counts = np.zeros(n_rows, dtype=np.int64)
+    for i in prange(n_rows):
+        row = _affine_row(a, k, indptr, indices, data, i, np.empty(n_cols, dtype=a.dtype))
+        counts[i] = np.count_nonzero(row)
+    V_indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    V_indptr[1:] = np.cumsum(counts)
+    V_indices, V_data = np.empty(V_indptr[-1], dtype=np.int64), np.empty(V_indptr[-1], dtype=a.dtype)
+    for i in prange(n_rows):
+        row = _affine_row(a, k, indptr, indices, data, i, np.empty(n_cols, dtype=a.dtype))
+        p = V_indptr[i]
+        for j in range(n_cols):
+            if row[j] != 0:
+                V_indices[p], V_data[p] = j, row[j]
+                p += 1
+    return V_indptr, V_indices, V_data
+
+
+def _is_column(x, n_genes):
+    return isinstance(x, np.ndarray) and x.shape == (n_genes, 1)
+
+
+def _fuses_with(alpha, shape):
+    """Whether alpha is a dense genes x cells matrix or genes x 1 column, the forms the kernels broadcast over a genes x
+    cells matrix of the given shape."""
+    return (
+        isinstance(alpha, np.ndarray)
+        and alpha.ndim == 2
+        and alpha.shape[0] == shape[0]
+        and alpha.shape[1] in (1, shape[1])
+    )
+
+
+def _subtract(x, y, out=None):
+    """`x - y`, written into `out` when it is given and the difference is dense."""
+    if out is None or issparse(x) or issparse(y):
+        V = x - y
+        if out is not None and not issparse(V):
+            out[:] = V
+            V = out
+        return V
+    return np.subtract(x, y, out=out)
+
+
 class Velocity:
     """The class that computes RNA/protein velocity given unknown parameters.
 
@@ -40,6 +133,15 @@ class Velocity:
             A vector of the measured time points for cells
         estimation: :class:`~ss_estimation`
             An instance of the estimation class. If this not None, the parameters will be taken from this class instead of the input arguments.
+        dtype: :class:`~numpy.dtype` (default: `np.float64`)
+            The floating point type the parameters are stored in and the velocities are computed in. `np.float32` halves
+            the memory traffic of the velocity arithmetic at the cost of precision (about 7 significant digits), which
+            is usually well below the noise of the estimated kinetic parameters.
+        backend: str (default: `numpy`)
+            Where the velocities are computed, either `numpy` or `cupy`. With `cupy` the expression counts (numpy,
+            scipy sparse or cupy arrays) are moved to the GPU once and reused across `vel_u`, `vel_s` and `vel_p` calls,
+            and the velocities are returned as cupy arrays or cupyx sparse matrices that stay on the device. The device
+            copies of the up to four most recent inputs are kept until `clear_device_cache` is called.
     """
 
     def __init__(
@@ -51,6 +153,8 @@ class Velocity:
         delta=None,
         t=None,
         estimation=None,
+        dtype=np.float64,
+        backend="numpy",
     ):
         if estimation is not None:
             self.parameters = {}
@@ -69,8 +173,24 @@ class Velocity:
                 "delta": delta,
                 "t": t,
             }
-
-    def vel_u(self, U, repeat=None, update_alpha=True):
+        self.dtype = np.dtype(dtype)
+        if backend not in ["numpy", "cupy"]:
+            raise ValueError(f"backend {backend} is not supported, only `numpy` and `cupy` are available.")
+        self.backend = backend
+        if backend == "cupy":
+            try:
+                import cupy
+                import cupyx.scipy.sparse
+            except ImportError:
+                raise ImportError("Please install cupy to compute velocities on the GPU.")
+            self._cp, self._cp_sparse = cupy, cupyx.scipy.sparse
+        self._device_inputs = {}
+        for key in ["alpha", "beta", "gamma", "eta", "delta"]:
+            self.parameters[key] = self._as_dtype(self.parameters[key])
+        self._t_key, self._t_uniq, self._t_cnt, self._t_inv = None, None, None, None
+        self._expanded = {}
+
+    def vel_u(self, U, repeat=None, update_alpha=True, out=None):
         """Calculate the unspliced mRNA velocity.
 
         Arguments
@@ -80,6 +200,10 @@ class Velocity:
             repeat: bool or None
                 Whether to use average alpha or cell-wise alpha with the formula:
                 $a = \frac{n \gamma}{1 - e^{-\gamma t}}$.
+            out: :class:`~numpy.ndarray` or None (default: None)
+                A preallocated array of shape genes x cells and of `dtype` the velocity is written into when it is
+                dense, so that repeated calls don't need to allocate a new one. For a sparse U the velocity is a csr
+                matrix, unless `out` is given, in which case it is written into `out` densely.
 
         Returns
         -------
@@ -87,87 +211,48 @@ class Velocity:
                 Each column of V is a velocity vector for the corresponding cell. Dimension: genes x cells.
         """
 
-        t = self.parameters["t"]
-        t_uniq, t_uniq_cnt = np.unique(self.parameters["t"], return_counts=True)
+        self._check_out(out, U.shape)
+        self._compute_t_cache()
+        n_cells = U.shape[1]
         if self.parameters["alpha"] is not None:
-            if self.parameters["beta"] is None and self.parameters["gamma"] is not None:
-                no_beta = True
-                self.parameters["beta"] = self.parameters["gamma"]
-            else:
-                no_beta = False
+            # without a splicing rate the unspliced mRNA is degraded with gamma
+            beta_eff = (
+                self.parameters["gamma"]
+                if self.parameters["beta"] is None and self.parameters["gamma"] is not None
+                else self.parameters["beta"]
+            )
 
             if type(self.parameters["alpha"]) is not tuple:
                 if repeat is None:
                     repeat = False
 
-                if self.parameters["alpha"].ndim == 1:
-                    alpha = (
-                        np.repeat(
-                            self.parameters["alpha"].reshape((-1, 1)),
-                            U.shape[1],
-                            axis=1,
-                        )
-                        if repeat
-                        else one_shot_alpha_matrix(U, self.parameters["gamma"], self.parameters["t"])
-                    )
-                elif self.parameters["alpha"].shape[1] == U.shape[1]:
-                    alpha = self.parameters["alpha"]
-                elif self.parameters["alpha"].shape[1] == len(t_uniq) and len(t_uniq) > 1:
-                    alpha = np.zeros(U.shape)
-                    for i in range(len(t_uniq)):
-                        cell_inds = t == t_uniq[i]
-                        alpha[:, cell_inds] = np.repeat(
-                            self.parameters["alpha"][:, i],
-                            t_uniq_cnt[i],
-                            axis=1,
-                        )
+                if self.parameters["alpha"].ndim == 1 and not repeat:
+                    alpha = one_shot_alpha_matrix(U, self.parameters["gamma"], self.parameters["t"])
                 else:
-                    alpha = np.repeat(self.parameters["alpha"], U.shape[1], axis=1)
+                    # alpha is stored back into the parameters, so it is never expanded into a reused buffer
+                    alpha = self._expand_param(None, self.parameters["alpha"], n_cells)
             else:  # need to correct the velocity vector prediction when you use mix_std_stm experiments
                 # if repeat is None: repeat = True # not used for now
-                if self.parameters["alpha"][1].shape[1] == U.shape[1]:
-                    alpha = self.parameters["alpha"][1]
-                elif self.parameters["alpha"][1].shape[1] == len(t_uniq) and len(t_uniq) > 1:
-                    alpha = np.zeros(U.shape)
-                    for i in range(len(t_uniq)):
-                        cell_inds = t == t_uniq[i]
-                        alpha[:, cell_inds] = np.repeat(
-                            self.parameters["alpha"][1][:, i].reshape(-1, 1),
-                            t_uniq_cnt[i],
-                            axis=1,
-                        )
-                else:
-                    alpha = np.repeat(self.parameters["alpha"][1], U.shape[1], axis=1)
-
-            if self.parameters["beta"].ndim == 1:
-                beta = np.repeat(self.parameters["beta"].reshape((-1, 1)), U.shape[1], axis=1)
-            elif self.parameters["beta"].shape[1] == len(t_uniq) and len(t_uniq) > 1:
-                beta = np.zeros_like(U.shape)
-                for i in range(len(t_uniq)):
-                    cell_inds = t == t_uniq[i]
-                    beta[:, cell_inds] = np.repeat(
-                        self.parameters["beta"][:, i].reshape(-1, 1),
-                        t_uniq_cnt[i],
-                        axis=1,
-                    )
+                alpha = self._expand_param(None, self.parameters["alpha"][1], n_cells)
+
+            beta = self._expand_param("beta", beta_eff, n_cells)
+
+            if self.backend == "cupy":
+                V = self._device_subtract(alpha, self._device_scale(beta, U))
             else:
-                beta = np.repeat(self.parameters["beta"], U.shape[1], axis=1)
-
-            if no_beta:
-                self.parameters["beta"] = None
-            V = (
-                csr_matrix(alpha, dtype=np.float64) - (csr_matrix(beta, dtype=np.float64).multiply(U))
-                if issparse(U)
-                else alpha - beta * U
-            )
+                U, alpha, beta = self._as_dtype(U), self._as_dtype(alpha), self._as_dtype(beta)
+                V = self._kernel_sparse(alpha, beta, U, out) if issparse(U) else self._kernel_dense(alpha, beta, U, out)
             if update_alpha:
-                self.parameters["alpha"] = alpha
+                # a genes x 1 column is only broadcast inside the kernels, the stored alpha is expanded to every cell
+                self.parameters["alpha"] = (
+                    np.repeat(alpha, n_cells, axis=1) if _is_column(alpha, U.shape[0]) and n_cells > 1 else alpha
+                )
         else:
             V = np.nan
 
         return V
 
-    def vel_s(self, U, S):
+    def vel_s(self, U, S, out=None):
         """Calculate the unspliced mRNA velocity.
 
         Arguments
@@ -176,6 +261,10 @@ class Velocity:
                 A matrix of unspliced mRNA counts. Dimension: genes x cells.
             S: :class:`~numpy.ndarray` or sparse `csr_matrix`
                 A matrix of spliced mRNA counts. Dimension: genes x cells.
+            out: :class:`~numpy.ndarray` or None (default: None)
+                A preallocated array of shape genes x cells and of `dtype` the velocity is written into when it is
+                dense. Sparse inputs give a csr velocity, unless `out` is given for the velocity without splicing,
+                which is then written into `out` densely.
 
         Returns
         -------
@@ -183,60 +272,56 @@ class Velocity:
                 Each column of V is a velocity vector for the corresponding cell. Dimension: genes x cells.
         """
 
-        t = self.parameters["t"]
-        t_uniq, t_uniq_cnt = np.unique(self.parameters["t"], return_counts=True)
+        self._check_out(out, U.shape)
+        self._compute_t_cache()
+        n_cells = U.shape[1]
         if self.parameters["gamma"] is not None:
-            if self.parameters["beta"] is None and self.parameters["alpha"] is not None:
-                no_beta = True
-                self.parameters["beta"] = self.parameters["alpha"]
-            else:
-                no_beta = False
-
-            if self.parameters["beta"].ndim == 1:
-                beta = np.repeat(self.parameters["beta"].reshape((-1, 1)), U.shape[1], axis=1)
-            elif self.parameters["beta"].shape[1] == U.shape[1]:
-                beta = self.parameters["beta"]
-            elif self.parameters["beta"].shape[1] == len(t_uniq) and len(t_uniq) > 1:
-                beta = np.zeros_like(U.shape)
-                for i in range(len(t_uniq)):
-                    cell_inds = t == t_uniq[i]
-                    beta[:, cell_inds] = np.repeat(self.parameters["beta"][:, i], t_uniq_cnt[i], axis=1)
-            else:
-                beta = np.repeat(self.parameters["beta"], U.shape[1], axis=1)
+            # without a splicing rate the spliced mRNA is produced at the transcription rate
+            no_beta = self.parameters["beta"] is None and self.parameters["alpha"] is not None
+            beta_eff = self.parameters["alpha"] if no_beta else self.parameters["beta"]
 
-            if len(self.parameters["gamma"].shape) == 1:
-                gamma = np.repeat(
-                    self.parameters["gamma"].reshape((-1, 1)),
-                    U.shape[1],
-                    axis=1,
-                )
-            elif self.parameters["gamma"].shape[1] == U.shape[1]:
-                gamma = self.parameters["gamma"]
-            elif self.parameters["gamma"].shape[1] == len(t_uniq) and len(t_uniq) > 1:
-                gamma = np.zeros_like(U.shape)
-                for i in range(len(t_uniq)):
-                    cell_inds = t == t_uniq[i]
-                    gamma[:, cell_inds] = np.repeat(self.parameters["gamma"][:, i], t_uniq_cnt[i], axis=1)
-            else:
-                gamma = np.repeat(self.parameters["gamma"], U.shape[1], axis=1)
+            beta, gamma = (
+                self._expand_param("beta", beta_eff, n_cells),
+                self._expand_param("gamma", self.parameters["gamma"], n_cells),
+            )
 
-            if no_beta:
-                V = (
-                    csr_matrix(beta, dtype=np.float64) - csr_matrix(gamma, dtype=np.float64).multiply(S)
-                    if issparse(U)
-                    else beta - gamma * S
+            if self.backend == "cupy":
+                V = self._device_subtract(
+                    beta if no_beta else self._device_scale(beta, U),
+                    self._device_scale(gamma, S),
                 )
             else:
-                V = (
-                    csr_matrix(beta, dtype=np.float64).multiply(U) - csr_matrix(gamma, dtype=np.float64).multiply(S)
-                    if issparse(U)
-                    else beta * U - gamma * S
-                )
+                U, S, beta, gamma = self._as_dtype(U), self._as_dtype(S), self._as_dtype(beta), self._as_dtype(gamma)
+                if no_beta:
+                    V = (
+                        self._kernel_sparse(beta, gamma, S, out)
+                        if issparse(S)
+                        else self._kernel_dense(beta, gamma, S, out)
+                    )
+                else:
+                    if issparse(U) or issparse(S):
+                        # scale each term in its own format, U and S may differ in format
+                        V = _subtract(
+                            U.multiply(beta) if issparse(U) else beta * U,
+                            S.multiply(gamma) if issparse(S) else gamma * S,
+                            out,
+                        )
+                        V = V.tocsr() if issparse(V) else np.asarray(V)
+                    elif _is_column(beta, U.shape[0]) and _is_column(gamma, U.shape[0]) and U.shape == S.shape:
+                        V = _vel_s_kernel(
+                            np.asarray(beta[:, 0], dtype=self.dtype),
+                            np.asarray(gamma[:, 0], dtype=self.dtype),
+                            np.asarray(U, dtype=self.dtype),
+                            np.asarray(S, dtype=self.dtype),
+                            np.empty(U.shape, dtype=self.dtype) if out is None else out,
+                        )
+                    else:
+                        V = _subtract(beta * U, gamma * S, out)
         else:
             V = np.nan
         return V
 
-    def vel_p(self, S, P):
+    def vel_p(self, S, P, out=None):
         """Calculate the protein velocity.
 
         Arguments
@@ -245,6 +330,9 @@ class Velocity:
                 A matrix of spliced mRNA counts. Dimension: genes x cells.
             P: :class:`~numpy.ndarray` or sparse `csr_matrix`
                 A matrix of protein counts. Dimension: genes x cells.
+            out: :class:`~numpy.ndarray` or None (default: None)
+                A preallocated array of shape genes x cells and of `dtype` the velocity is written into when it is
+                dense.
 
         Returns
         -------
@@ -252,46 +340,185 @@ class Velocity:
                 Each column of V is a velocity vector for the corresponding cell. Dimension: genes x cells.
         """
 
-        t = self.parameters["t"]
-        t_uniq, t_uniq_cnt = np.unique(self.parameters["t"], return_counts=True)
+        self._check_out(out, S.shape)
+        self._compute_t_cache()
+        n_cells = S.shape[1]
         if self.parameters["eta"] is not None and self.parameters["delta"] is not None:
-            if self.parameters["eta"].ndim == 1:
-                eta = np.repeat(self.parameters["eta"].reshape((-1, 1)), S.shape[1], axis=1)
-            elif self.parameters["eta"].shape[1] == S.shape[1]:
-                eta = self.parameters["eta"]
-            elif self.parameters["eta"].shape[1] == len(t_uniq) and len(t_uniq) > 1:
-                eta = np.zeros_like(S.shape)
-                for i in range(len(t_uniq)):
-                    cell_inds = t == t_uniq[i]
-                    eta[:, cell_inds] = np.repeat(self.parameters["eta"][:, i], t_uniq_cnt[i], axis=1)
-            else:
-                eta = np.repeat(self.parameters["eta"], S.shape[1], axis=1)
+            eta, delta = (
+                self._expand_param("eta", self.parameters["eta"], n_cells),
+                self._expand_param("delta", self.parameters["delta"], n_cells),
+            )
 
-            if len(self.parameters["delta"].shape) == 1:
-                delta = np.repeat(
-                    self.parameters["delta"].reshape((-1, 1)),
-                    S.shape[1],
-                    axis=1,
-                )
-            elif self.parameters["delta"].shape[1] == S.shape[1]:
-                delta = self.parameters["delta"]
-            elif self.parameters["delta"].shape[1] == len(t_uniq) and len(t_uniq) > 1:
-                delta = np.zeros_like(S.shape)
-                for i in range(len(t_uniq)):
-                    cell_inds = t == t_uniq[i]
-                    delta[:, cell_inds] = np.repeat(self.parameters["delta"][:, i], t_uniq_cnt[i], axis=1)
+            if self.backend == "cupy":
+                V = self._device_subtract(self._device_scale(eta, S), self._device_scale(delta, P))
             else:
-                delta = np.repeat(self.parameters["delta"], S.shape[1], axis=1)
-
-            V = (
-                csr_matrix(eta, dtype=np.float64).multiply(S) - csr_matrix(delta, dtype=np.float64).multiply(P)
-                if issparse(P)
-                else eta * S - delta * P
-            )
+                S, P, eta, delta = self._as_dtype(S), self._as_dtype(P), self._as_dtype(eta), self._as_dtype(delta)
+                if issparse(S) or issparse(P):
+                    # scale the rows of the sparse matrices in place of densifying them, S and P may differ in format
+                    V = _subtract(
+                        S.multiply(eta) if issparse(S) else eta * S,
+                        P.multiply(delta) if issparse(P) else delta * P,
+                        out,
+                    )
+                    V = V.tocsr() if issparse(V) else np.asarray(V)
+                elif _is_column(eta, S.shape[0]) and _is_column(delta, S.shape[0]) and S.shape == P.shape:
+                    V = _vel_s_kernel(
+                        np.asarray(eta[:, 0], dtype=self.dtype),
+                        np.asarray(delta[:, 0], dtype=self.dtype),
+                        np.asarray(S, dtype=self.dtype),
+                        np.asarray(P, dtype=self.dtype),
+                        np.empty(S.shape, dtype=self.dtype) if out is None else out,
+                    )
+                else:
+                    V = _subtract(eta * S, delta * P, out)
         else:
             V = np.nan
         return V
 
+    def _check_out(self, out, shape):
+        """Check that a preallocated `out` buffer can be written into by the compiled kernels, which neither check the
+        bounds nor cast."""
+        if out is None:
+            return
+        if not isinstance(out, np.ndarray) or out.shape != tuple(shape):
+            raise ValueError(f"out must be a numpy array of shape {tuple(shape)}.")
+        if out.dtype != self.dtype:
+            raise ValueError(f"out must be of dtype {self.dtype}, but is of dtype {out.dtype}.")
+        if not out.flags.c_contiguous:
+            raise ValueError("out must be C-contiguous.")
+
+    def _to_device(self, X):
+        """Move a dense or sparse matrix to the GPU. The device copies of the most recent inputs are cached by identity,
+        so that passing the same U/S/P to `vel_u`, `vel_s` and `vel_p` transfers them only once."""
+        cp, cp_sparse = self._cp, self._cp_sparse
+        if isinstance(X, cp.ndarray) or cp_sparse.issparse(X):
+            # the `astype` of cupyx sparse matrices always copies and doesn't accept `copy`
+            return X if X.dtype == self.dtype else X.astype(self.dtype)
+        if id(X) not in self._device_inputs:
+            if len(self._device_inputs) >= 4:
+                self._device_inputs.pop(next(iter(self._device_inputs)))
+            X_dev = (
+                cp_sparse.csr_matrix(X.tocsr().astype(self.dtype, copy=False))
+                if issparse(X)
+                else cp.asarray(X, dtype=self.dtype)
+            )
+            # keep a reference to X so that its id can't be reused by another array while it is cached
+            self._device_inputs[id(X)] = (X, X_dev)
+        return self._device_inputs[id(X)][1]
+
+    def clear_device_cache(self):
+        """Release the device copies of the inputs cached by the `cupy` backend, e.g. once the velocities of a dataset
+        are computed, so that they don't hold on to GPU memory for the lifetime of this instance."""
+        self._device_inputs.clear()
+
+    def _param_to_device(self, k):
+        """Move a (possibly expanded) parameter to the GPU. Parameters are not cached since their expansions are
+        recreated by every call."""
+        cp, cp_sparse = self._cp, self._cp_sparse
+        if isinstance(k, cp.ndarray) or cp_sparse.issparse(k):
+            return k
+        return (
+            cp_sparse.csr_matrix(k.tocsr().astype(self.dtype))
+            if issparse(k)
+            else cp.asarray(np.asarray(k), dtype=self.dtype)
+        )
+
+    def _device_scale(self, k, X):
+        """Scale the rows of X by the parameter k (a genes x 1 column or a genes x cells matrix) on the GPU."""
+        X, k = self._to_device(X), self._param_to_device(k)
+        if self._cp_sparse.issparse(k):
+            k = k.toarray()
+        return X.multiply(k) if self._cp_sparse.issparse(X) else k * X
+
+    def _device_subtract(self, x, y):
+        """`x - y` on the GPU, densifying a sparse operand only when the other one is dense."""
+        cp_sparse = self._cp_sparse
+        x = self._param_to_device(x)
+        if cp_sparse.issparse(x) and cp_sparse.issparse(y):
+            return (x - y).tocsr()
+        x, y = [v.toarray() if cp_sparse.issparse(v) else v for v in (x, y)]
+        return x - y
+
+    def _kernel_sparse(self, a, k, X, out=None):
+        """`a - k * X` for a sparse X, a per-gene k and a dense or sparse a.
+
+        The velocity of a sparse X is a csr matrix, which for a dense `a` is built directly from `a` and the stored
+        entries of X. Only when a dense `out` buffer is given is the difference written into it instead, with `k * X`
+        subtracted at the stored entries of X only.
+        """
+        X = X.tocsr()
+        if issparse(a):
+            return (a - X.multiply(k)).tocsr()
+        if not (_fuses_with(a, X.shape) and _is_column(k, X.shape[0])):
+            V = _subtract(np.asarray(a), X.multiply(k).toarray(), out)
+            return V if out is not None else csr_matrix(V)
+        a, k = np.asarray(a, dtype=self.dtype), np.asarray(k[:, 0], dtype=self.dtype)
+        if out is None:
+            indptr, indices, data = _csr_affine_kernel(a, k, X.indptr, X.indices, X.data, X.shape[1])
+            return csr_matrix((data, indices, indptr), shape=X.shape)
+        out[:] = a
+        return _csr_subtract_kernel(out, X.indptr, X.indices, X.data, k)
+
+    def _kernel_dense(self, a, k, X, out=None):
+        """`a - k * X` for a dense X, with the fused kernel when a is a genes x cells matrix or a genes x 1 column and k
+        is a per-gene column."""
+        if _fuses_with(a, X.shape) and _is_column(k, X.shape[0]):
+            return _vel_u_kernel(
+                np.asarray(a, dtype=self.dtype),
+                np.asarray(k[:, 0], dtype=self.dtype),
+                np.asarray(X, dtype=self.dtype),
+                np.empty(X.shape, dtype=self.dtype) if out is None else out,
+            )
+        return _subtract(a, k * X, out)
+
+    def _as_dtype(self, X):
+        """Cast a dense or sparse array to `self.dtype`, without copying when it already has that type."""
+        if issparse(X) or isinstance(X, np.ndarray):
+            return X.astype(self.dtype, copy=False)
+        return X
+
+    def _expand_param(self, name, param, n_cells):
+        """Bring a parameter into a form that broadcasts against a genes x cells matrix.
+
+        A per-gene vector becomes a genes x 1 column, a genes x time points matrix is expanded to the time point of each
+        cell (into the reused buffer `name`, or a new array when `name` is None) and anything else is returned as is.
+        """
+        if param.ndim == 1:
+            return param.reshape((-1, 1))
+        if param.shape[1] == n_cells:
+            return param
+        if param.shape[1] == len(self._t_uniq) and len(self._t_uniq) > 1:
+            return param[:, self._t_inv] if name is None else self._expand_time(name, param, self._t_inv)
+        return param
+
+    def _expand_time(self, name, param, t_inv):
+        """Expand a genes x time points parameter to genes x cells into the buffer `name` that is reused across calls.
+
+        The expansion is cached by the identity of the parameter and of the time points, so repeated calls with the same
+        parameters skip it; parameters have to be reassigned rather than modified in place for a change to be picked
+        up. Only parameters that don't end up in the returned velocity or in `self.parameters` are expanded this way,
+        since the buffer is overwritten once the parameter changes.
+        """
+        cached_param, cached_t, buf = self._expanded.get(name, (None, None, None))
+        if cached_param is param and cached_t is self._t_key:
+            return buf
+
+        shape = (param.shape[0], len(t_inv))
+        if buf is None or buf.shape != shape or buf.dtype != self.dtype:
+            buf = np.empty(shape, dtype=self.dtype)
+        np.take(param.astype(self.dtype, copy=False), t_inv, axis=1, out=buf)
+        # keep a reference to the parameter so that its id can't be reused by another array while it is cached
+        self._expanded[name] = (param, self._t_key, buf)
+        return buf
+
+    def _compute_t_cache(self):
+        """Compute the unique time points, their counts and the time point index of each cell once, and reuse them until
+        `self.parameters["t"]` is reassigned."""
+        t = self.parameters["t"]
+        if self._t_uniq is None or self._t_key is not t:
+            self._t_uniq, self._t_inv, self._t_cnt = np.unique(t, return_inverse=True, return_counts=True)
+            self._t_key = t
+
     def get_n_cells(self):
         """Get the number of cells if the parameter alpha is given.
 
@@ -371,8 +598,10 @@ class ss_estimation:
         concat_data: bool (default: True)
             Whether to concatenate data
         cores: `int` (default: 1)
-            Number of cores to run the estimation. If cores is set to be > 1, multiprocessing will be used to parallel
-            the parameter estimation.
+            Number of threads of the thread pool (`multiprocessing.dummy`) that fits the genes one by one when the
+            steady state or stochastic fit has no vectorized version, i.e. with an `est_method` other than `ols` or
+            `gmm` respectively. The other fits are vectorized over the genes or run in numba kernels whose threads are
+            set by numba (`NUMBA_NUM_THREADS`) instead.
 
     Returns
     ----------
@@ -418,6 +647,7 @@ class ss_estimation:
     ):
 
         self.t = t
+        self._t_key = None
         self.data = {
             "uu": U,
             "ul": Ul,
@@ -467,6 +697,27 @@ class ss_estimation:
         }  # note that alpha_intercept also corresponds to u0 in fit_alpha_degradation, similar to fit_first_order_deg_lsq
         self.ind_for_proteins = ind_for_proteins
 
+    @property
+    def ind_for_proteins(self):
+        return self._ind_for_proteins
+
+    @ind_for_proteins.setter
+    def ind_for_proteins(self, ind):
+        # resolve the indices (or a boolean mask) to integer row indices once so that selecting the protein genes
+        # from the csr layers is a plain row gather; assigning new indices replaces the resolved ones.
+        if ind is not None:
+            ind = np.asarray(ind)
+            ind = np.flatnonzero(ind) if ind.dtype == bool else ind.astype(int, copy=False)
+        self._ind_for_proteins = ind
+
+    def _compute_t_cache(self):
+        """Compute the sorted unique time points, the cells of each time point and the first and last time point once,
+        and reuse them until `self.t` is reassigned."""
+        if self.t is not None and self._t_key is not self.t:
+            self._t_uniq, self._t_groups = group_by_time(self.t)
+            self._t_min, self._t_max = self._t_uniq[0], self._t_uniq[-1]
+            self._t_key = self.t
+
     def fit(
         self,
         intercept=False,
@@ -490,1067 +741,439 @@ class ss_estimation:
             clusters: `list`
                 A list of n clusters, each element is a list of indices of the samples which belong to this cluster.
         """
-        n_genes = self.get_n_genes()
-        cores = max(1, int(self.cores))
-        # fit mRNA
-        if self.extyp.lower() in ["conventional", "kin"]:
-            if self.model.lower() == "deterministic":
-                if np.all(self._exist_data("uu", "su")):
-                    self.parameters["beta"] = np.ones(n_genes)
-                    gamma, gamma_intercept, gamma_r2, gamma_logLL = (
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                    )
-                    U = self.data["uu"] if self.data["ul"] is None else self.data["uu"] + self.data["ul"]
-                    S = self.data["su"] if self.data["sl"] is None else self.data["su"] + self.data["sl"]
-                    if cores == 1:
-                        for i in tqdm(range(n_genes), desc="estimating gamma"):
-                            (
-                                gamma[i],
-                                gamma_intercept[i],
-                                _,
-                                gamma_r2[i],
-                                _,
-                                gamma_logLL[i],
-                            ) = self.fit_gamma_steady_state(U[i], S[i], intercept, perc_left, perc_right)
-                    else:
-                        pool = ThreadPool(cores)
-                        res = pool.starmap(
-                            self.fit_gamma_steady_state,
-                            zip(
-                                U,
-                                S,
-                                itertools.repeat(intercept),
-                                itertools.repeat(perc_left),
-                                itertools.repeat(perc_right),
-                            ),
-                        )
-                        pool.close()
-                        pool.join()
-                        (
-                            gamma,
-                            gamma_intercept,
-                            _,
-                            gamma_r2,
-                            _,
-                            gamma_logLL,
-                        ) = zip(*res)
-                        (gamma, gamma_intercept, gamma_r2, gamma_logLL) = (
-                            np.array(gamma),
-                            np.array(gamma_intercept),
-                            np.array(gamma_r2),
-                            np.array(gamma_logLL),
-                        )
-                    (
-                        self.parameters["gamma"],
-                        self.aux_param["gamma_intercept"],
-                        self.aux_param["gamma_r2"],
-                        self.aux_param["gamma_logLL"],
-                    ) = (gamma, gamma_intercept, gamma_r2, gamma_logLL)
-                elif np.all(self._exist_data("uu", "ul")):
-                    self.parameters["beta"] = np.ones(n_genes)
-                    gamma, gamma_intercept, gamma_r2, gamma_logLL = (
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                    )
-                    U = self.data["ul"]
-                    S = self.data["uu"] + self.data["ul"]
-                    if cores == 1:
-                        for i in tqdm(range(n_genes), desc="estimating gamma"):
-                            (
-                                gamma[i],
-                                gamma_intercept[i],
-                                _,
-                                gamma_r2[i],
-                                _,
-                                gamma_logLL[i],
-                            ) = self.fit_gamma_steady_state(U[i], S[i], intercept, perc_left, perc_right)
-                    else:
-                        pool = ThreadPool(cores)
-                        res = pool.starmap(
-                            self.fit_gamma_steady_state,
-                            zip(
-                                U,
-                                S,
-                                itertools.repeat(intercept),
-                                itertools.repeat(perc_left),
-                                itertools.repeat(perc_right),
-                            ),
-                        )
-                        pool.close()
-                        pool.join()
-                        (
-                            gamma,
-                            gamma_intercept,
-                            _,
-                            gamma_r2,
-                            _,
-                            gamma_logLL,
-                        ) = zip(*res)
-                        (gamma, gamma_intercept, gamma_r2, gamma_logLL) = (
-                            np.array(gamma),
-                            np.array(gamma_intercept),
-                            np.array(gamma_r2),
-                            np.array(gamma_logLL),
-                        )
-                    (
-                        self.parameters["gamma"],
-                        self.aux_param["gamma_intercept"],
-                        self.aux_param["gamma_r2"],
-                        self.aux_param["gamma_logLL"],
-                    ) = (gamma, gamma_intercept, gamma_r2, gamma_logLL)
-            elif self.model.lower() == "stochastic":
-                if np.all(self._exist_data("uu", "su")):
-                    self.parameters["beta"] = np.ones(n_genes)
-                    gamma, gamma_intercept, gamma_r2, gamma_logLL, bs, bf = (
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                    )
-                    U = self.data["uu"] if self.data["ul"] is None else self.data["uu"] + self.data["ul"]
-                    S = self.data["su"] if self.data["sl"] is None else self.data["su"] + self.data["sl"]
-                    US = (
-                        self.data["us"]
-                        if self.data["us"] is not None
-                        else calc_2nd_moment(U.T, S.T, self.conn, mX=U.T, mY=S.T).T
-                    )
-                    S2 = (
-                        self.data["s2"]
-                        if self.data["s2"] is not None
-                        else calc_2nd_moment(S.T, S.T, self.conn, mX=S.T, mY=S.T).T
-                    )
-                    if cores == 1:
-                        for i in tqdm(range(n_genes), desc="estimating gamma"):
-                            (
-                                gamma[i],
-                                gamma_intercept[i],
-                                _,
-                                gamma_r2[i],
-                                _,
-                                gamma_logLL[i],
-                                bs[i],
-                                bf[i],
-                            ) = self.fit_gamma_stochastic(
-                                self.est_method,
-                                U[i],
-                                S[i],
-                                US[i],
-                                S2[i],
-                                perc_left=perc_left,
-                                perc_right=perc_right,
-                                normalize=True,
-                            )
-                    else:
-                        pool = ThreadPool(cores)
-                        res = pool.starmap(
-                            self.fit_gamma_stochastic,
-                            zip(
-                                itertools.repeat(self.est_method),
-                                U,
-                                S,
-                                US,
-                                S2,
-                                itertools.repeat(perc_left),
-                                itertools.repeat(perc_right),
-                                itertools.repeat(True),
-                            ),
-                        )
-                        pool.close()
-                        pool.join()
-                        (
-                            gamma,
-                            gamma_intercept,
-                            _,
-                            gamma_r2,
-                            _,
-                            gamma_logLL,
-                            bs,
-                            bf,
-                        ) = zip(*res)
-                        (gamma, gamma_intercept, gamma_r2, gamma_logLL, bs, bf,) = (
-                            np.array(gamma),
-                            np.array(gamma_intercept),
-                            np.array(gamma_r2),
-                            np.array(gamma_logLL),
-                            np.array(bs),
-                            np.array(bf),
-                        )
-                    (
-                        self.parameters["gamma"],
-                        self.aux_param["gamma_intercept"],
-                        self.aux_param["gamma_r2"],
-                        self.aux_param["gamma_logLL"],
-                        self.aux_param["bs"],
-                        self.aux_param["bf"],
-                    ) = (gamma, gamma_intercept, gamma_r2, gamma_logLL, bs, bf)
-                elif np.all(self._exist_data("uu", "ul")):
-                    self.parameters["beta"] = np.ones(n_genes)
-                    gamma, gamma_intercept, gamma_r2, gamma_logLL, bs, bf = (
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                    )
-                    U = self.data["ul"]
-                    S = self.data["uu"] + self.data["ul"]
-                    US = (
-                        self.data["us"]
-                        if self.data["us"] is not None
-                        else calc_2nd_moment(U.T, S.T, self.conn, mX=U.T, mY=S.T).T
-                    )
-                    S2 = (
-                        self.data["s2"]
-                        if self.data["s2"] is not None
-                        else calc_2nd_moment(S.T, S.T, self.conn, mX=S.T, mY=S.T).T
-                    )
-                    if cores == 1:
-                        for i in tqdm(range(n_genes), desc="estimating gamma"):
-                            (
-                                gamma[i],
-                                gamma_intercept[i],
-                                _,
-                                gamma_r2[i],
-                                _,
-                                gamma_logLL[i],
-                                bs[i],
-                                bf[i],
-                            ) = self.fit_gamma_stochastic(
-                                self.est_method,
-                                U[i],
-                                S[i],
-                                US[i],
-                                S2[i],
-                                perc_left=perc_left,
-                                perc_right=perc_right,
-                                normalize=True,
-                            )
-                    else:
-                        pool = ThreadPool(cores)
-                        res = pool.starmap(
-                            self.fit_gamma_stochastic,
-                            zip(
-                                itertools.repeat(self.est_method),
-                                U,
-                                S,
-                                US,
-                                S2,
-                                itertools.repeat(perc_left),
-                                itertools.repeat(perc_right),
-                                itertools.repeat(True),
-                            ),
-                        )
-                        pool.close()
-                        pool.join()
-                        (
-                            gamma,
-                            gamma_intercept,
-                            _,
-                            gamma_r2,
-                            _,
-                            gamma_logLL,
-                            bs,
-                            bf,
-                        ) = zip(*res)
-                        (gamma, gamma_intercept, gamma_r2, gamma_logLL, bs, bf,) = (
-                            np.array(gamma),
-                            np.array(gamma_intercept),
-                            np.array(gamma_r2),
-                            np.array(gamma_logLL),
-                            np.array(bs),
-                            np.array(bf),
-                        )
-
-                    (
-                        self.parameters["gamma"],
-                        self.aux_param["gamma_intercept"],
-                        self.aux_param["gamma_r2"],
-                        self.aux_param["gamma_logLL"],
-                        self.aux_param["bs"],
-                        self.aux_param["bf"],
-                    ) = (gamma, gamma_intercept, gamma_r2, gamma_logLL, bs, bf)
-        else:
-            if self.extyp.lower() == "deg":
-                if np.all(self._exist_data("ul", "sl")):
-                    # beta & gamma estimation
-                    ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
-                    sl_m, sl_v, _ = calc_12_mom_labeling(self.data["sl"], self.t)
-                    (
-                        self.parameters["beta"],
-                        self.parameters["gamma"],
-                        self.aux_param["ul0"],
-                        self.aux_param["sl0"],
-                    ) = self.fit_beta_gamma_lsq(t_uniq, ul_m, sl_m)
-                    if self._exist_data("uu"):
-                        # alpha estimation
-                        uu_m, uu_v, _ = calc_12_mom_labeling(self.data["uu"], self.t)
-                        alpha, uu0, r2 = (
-                            np.zeros((n_genes, 1)),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                        )
-                        if cores == 1:
-                            for i in range(n_genes):
-                                alpha[i], uu0[i], r2[i] = fit_alpha_degradation(
-                                    t_uniq,
-                                    uu_m[i],
-                                    self.parameters["beta"][i],
-                                    intercept=True,
-                                )
-                        else:
-                            pool = ThreadPool(cores)
-                            res = pool.starmap(
-                                fit_alpha_degradation,
-                                zip(
-                                    itertools.repeat(t_uniq),
-                                    uu_m,
-                                    self.parameters["beta"],
-                                    itertools.repeat(True),
-                                ),
-                            )
-                            pool.close()
-                            pool.join()
-                            (alpha, uu0, r2) = zip(*res)
-                            (alpha, uu0, r2) = (
-                                np.array(alpha),
-                                np.array(uu0),
-                                np.array(r2),
-                            )
-                        (
-                            self.parameters["alpha"],
-                            self.aux_param["alpha_intercept"],
-                            self.aux_param["uu0"],
-                            self.aux_param["alpha_r2"],
-                        ) = (alpha, uu0, uu0, r2)
-                elif self._exist_data("ul"):
-                    # gamma estimation
-                    # use mean + var for fitting degradation parameter k
-                    ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
-                    (
-                        self.parameters["gamma"],
-                        self.aux_param["ul0"],
-                    ) = self.fit_gamma_nosplicing_lsq(t_uniq, ul_m)
-                    if self._exist_data("uu"):
-                        # alpha estimation
-                        alpha, alpha_b, alpha_r2 = (
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                        )
-                        uu_m, uu_v, _ = calc_12_mom_labeling(self.data["uu"], self.t)
-                        if cores == 1:
-                            for i in tqdm(range(n_genes), desc="estimating alpha"):
-                                (alpha[i], alpha_b[i], alpha_r2[i],) = fit_alpha_degradation(
-                                    t_uniq,
-                                    uu_m[i],
-                                    self.parameters["gamma"][i],
-                                    intercept=True,
-                                )
-                        else:
-                            pool = ThreadPool(cores)
-                            res = pool.starmap(
-                                fit_alpha_degradation,
-                                zip(
-                                    itertools.repeat(t_uniq),
-                                    uu_m,
-                                    self.parameters["gamma"],
-                                    itertools.repeat(True),
-                                ),
-                            )
-                            pool.close()
-                            pool.join()
-                            (alpha, alpha_b, alpha_r2) = zip(*res)
-                            (alpha, alpha_b, alpha_r2) = (
-                                np.array(alpha),
-                                np.array(alpha_b),
-                                np.array(alpha_r2),
-                            )
-                        (
-                            self.parameters["alpha"],
-                            self.aux_param["alpha_intercept"],
-                            self.aux_param["uu0"],
-                            self.aux_param["alpha_r2"],
-                        ) = (alpha, alpha_b, alpha_b, alpha_r2)
-            elif (self.extyp.lower() == "kin" or self.extyp.lower() == "one-shot") and len(np.unique(self.t)) > 1:
-                if np.all(self._exist_data("ul", "uu", "su")):
-                    if not self._exist_parameter("beta"):
-                        warn("beta & gamma estimation: only works when there're at least 2 time points.")
-                        uu_m, uu_v, t_uniq = calc_12_mom_labeling(self.data["uu"], self.t)
-                        su_m, su_v, _ = calc_12_mom_labeling(self.data["su"], self.t)
-
-                        (
-                            self.parameters["beta"],
-                            self.parameters["gamma"],
-                            self.aux_param["uu0"],
-                            self.aux_param["su0"],
-                        ) = self.fit_beta_gamma_lsq(t_uniq, uu_m, su_m)
-                    # alpha estimation
-                    ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
-                    alpha = np.zeros(n_genes)
-                    # let us only assume one alpha for each gene in all cells
-                    if cores == 1:
-                        for i in tqdm(range(n_genes), desc="estimating alpha"):
-                            # for j in range(len(self.data['ul'][i])):
-                            alpha[i] = fit_alpha_synthesis(t_uniq, ul_m[i], self.parameters["beta"][i])
-                    else:
-                        pool = ThreadPool(cores)
-                        alpha = pool.starmap(
-                            fit_alpha_synthesis,
-                            zip(
-                                itertools.repeat(t_uniq),
-                                ul_m,
-                                self.parameters["beta"],
-                            ),
-                        )
-                        pool.close()
-                        pool.join()
-                        alpha = np.array(alpha)
-                    self.parameters["alpha"] = alpha
-                elif np.all(self._exist_data("ul", "uu")):
-                    n_genes = self.data["uu"].shape[0]  # self.get_n_genes(data=U)
-                    u0, gamma = np.zeros(n_genes), np.zeros(n_genes)
-                    uu_m, uu_v, t_uniq = calc_12_mom_labeling(self.data["uu"], self.t)
-                    for i in tqdm(range(n_genes), desc="estimating gamma"):
-                        try:
-                            gamma[i], u0[i] = fit_first_order_deg_lsq(t_uniq, uu_m[i])
-                        except:
-                            gamma[i], u0[i] = 0, 0
-                    self.parameters["gamma"], self.aux_param["uu0"] = gamma, u0
-                    alpha = np.zeros(n_genes)
-                    # let us only assume one alpha for each gene in all cells
-                    ul_m, ul_v, _ = calc_12_mom_labeling(self.data["ul"], self.t)
-                    if cores == 1:
-                        for i in tqdm(range(n_genes), desc="estimating gamma"):
-                            # for j in range(len(self.data['ul'][i])):
-                            alpha[i] = fit_alpha_synthesis(t_uniq, ul_m[i], self.parameters["gamma"][i])
-                    else:
-                        pool = ThreadPool(cores)
-                        alpha = pool.starmap(
-                            fit_alpha_synthesis,
-                            zip(
-                                itertools.repeat(t_uniq),
-                                ul_m,
-                                self.parameters["gamma"],
-                            ),
-                        )
-                        pool.close()
-                        pool.join()
-                        alpha = np.array(alpha)
-                    self.parameters["alpha"] = alpha
-                    # alpha: one-shot
-            # 'one_shot'
-            elif self.extyp.lower() == "one-shot":
-                t_uniq = np.unique(self.t)
-                if len(t_uniq) > 1:
-                    raise Exception(
-                        "By definition, one-shot experiment should involve only one time point measurement!"
-                    )
-                # calculate when having splicing or no splicing
-                if self.model.lower() == "deterministic":
-                    if np.all(self._exist_data("ul", "uu", "su")):
-                        if self._exist_parameter("beta", "gamma").all():
-                            self.parameters["alpha"] = self.fit_alpha_oneshot(
-                                self.t,
-                                self.data["ul"],
-                                self.parameters["beta"],
-                                clusters,
-                            )
-                        else:
-                            beta, gamma, U0, S0 = (
-                                np.zeros(n_genes),
-                                np.zeros(n_genes),
-                                np.zeros(n_genes),
-                                np.zeros(n_genes),
-                            )
-                            for i in range(
-                                n_genes
-                            ):  # can also use the two extreme time points and apply sci-fate like approach.
-                                S, U = (
-                                    self.data["su"][i] + self.data["sl"][i],
-                                    self.data["uu"][i] + self.data["ul"][i],
-                                )
-
-                                S0[i], gamma[i] = (
-                                    np.mean(S),
-                                    solve_gamma(np.max(self.t), self.data["su"][i], S),
-                                )
-                                U0[i], beta[i] = (
-                                    np.mean(U),
-                                    solve_gamma(np.max(self.t), self.data["uu"][i], U),
-                                )
-                            (
-                                self.aux_param["U0"],
-                                self.aux_param["S0"],
-                                self.parameters["beta"],
-                                self.parameters["gamma"],
-                            ) = (U0, S0, beta, gamma)
-
-                            ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
-                            alpha = np.zeros(n_genes)
-                            # let us only assume one alpha for each gene in all cells
-                            if cores == 1:
-                                for i in tqdm(range(n_genes), desc="estimating alpha"):
-                                    # for j in range(len(self.data['ul'][i])):
-                                    alpha[i] = fit_alpha_synthesis(
-                                        t_uniq,
-                                        ul_m[i],
-                                        self.parameters["beta"][i],
-                                    )
-                            else:
-                                pool = ThreadPool(cores)
-                                alpha = pool.starmap(
-                                    fit_alpha_synthesis,
-                                    zip(
-                                        itertools.repeat(t_uniq),
-                                        ul_m,
-                                        self.parameters["beta"],
-                                    ),
-                                )
-                                pool.close()
-                                pool.join()
-                                alpha = np.array(alpha)
-                            self.parameters["alpha"] = alpha
-                            # self.parameters['alpha'] = self.fit_alpha_oneshot(self.t, self.data['ul'], self.parameters['beta'], clusters)
-                    else:
-                        if self._exist_data("ul") and self._exist_parameter("gamma"):
-                            self.parameters["alpha"] = self.fit_alpha_oneshot(
-                                self.t,
-                                self.data["ul"],
-                                self.parameters["gamma"],
-                                clusters,
-                            )
-                        elif self._exist_data("ul") and self._exist_data("uu"):
-                            if one_shot_method in ["sci-fate", "sci_fate"]:
-                                gamma, total0 = np.zeros(n_genes), np.zeros(n_genes)
-                                for i in tqdm(range(n_genes), desc="estimating gamma"):
-                                    total = self.data["uu"][i] + self.data["ul"][i]
-                                    total0[i], gamma[i] = (
-                                        np.mean(total),
-                                        solve_gamma(
-                                            np.max(self.t),
-                                            self.data["uu"][i],
-                                            total,
-                                        ),
-                                    )
-                                (self.aux_param["total0"], self.parameters["gamma"],) = (
-                                    total0,
-                                    gamma,
-                                )
-
-                                ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
-                                # let us only assume one alpha for each gene in all cells
-                                alpha = np.zeros(n_genes)
-                                if cores == 1:
-                                    for i in tqdm(range(n_genes), desc="estimating alpha"):
-                                        # for j in range(len(self.data['ul'][i])):
-                                        alpha[i] = fit_alpha_synthesis(
-                                            t_uniq,
-                                            ul_m[i],
-                                            self.parameters["gamma"][i],
-                                        )  # ul_m[i] / t_uniq
-                                else:
-                                    pool = ThreadPool(cores)
-                                    alpha = pool.starmap(
-                                        fit_alpha_synthesis,
-                                        zip(
-                                            itertools.repeat(t_uniq),
-                                            ul_m,
-                                            self.parameters["gamma"],
-                                        ),
-                                    )
-                                    pool.close()
-                                    pool.join()
-                                    alpha = np.array(alpha)
-                                self.parameters["alpha"] = alpha
-                                # self.parameters['alpha'] = self.fit_alpha_oneshot(self.t, self.data['ul'], self.parameters['gamma'], clusters)
-                            elif one_shot_method == "combined":
-                                self.parameters["alpha"] = (
-                                    csr_matrix(self.data["ul"].shape)
-                                    if issparse(self.data["ul"])
-                                    else np.zeros_like(self.data["ul"].shape)
-                                )
-                                (t_uniq, gamma, gamma_k, gamma_intercept, gamma_r2, gamma_logLL,) = (
-                                    np.unique(self.t),
-                                    np.zeros(n_genes),
-                                    np.zeros(n_genes),
-                                    np.zeros(n_genes),
-                                    np.zeros(n_genes),
-                                    np.zeros(n_genes),
-                                )
-                                U, S = (
-                                    self.data["ul"],
-                                    self.data["uu"] + self.data["ul"],
-                                )
-
-                                if cores == 1:
-                                    for i in tqdm(range(n_genes), desc="estimating gamma"):
-                                        (
-                                            gamma_k[i],
-                                            gamma_intercept[i],
-                                            _,
-                                            gamma_r2[i],
-                                            _,
-                                            gamma_logLL[i],
-                                        ) = self.fit_gamma_steady_state(U[i], S[i], False, None, perc_right)
-                                        (
-                                            gamma[i],
-                                            self.parameters["alpha"][i],
-                                        ) = one_shot_gamma_alpha(gamma_k[i], t_uniq, U[i])
-                                else:
-                                    pool = ThreadPool(cores)
-                                    res1 = pool.starmap(
-                                        self.fit_gamma_steady_state,
-                                        zip(
-                                            U,
-                                            S,
-                                            itertools.repeat(False),
-                                            itertools.repeat(None),
-                                            itertools.repeat(perc_right),
-                                        ),
-                                    )
-
-                                    (
-                                        gamma_k,
-                                        gamma_intercept,
-                                        _,
-                                        gamma_r2,
-                                        _,
-                                        gamma_logLL,
-                                    ) = zip(*res1)
-                                    (gamma_k, gamma_intercept, gamma_r2, gamma_logLL,) = (
-                                        np.array(gamma_k),
-                                        np.array(gamma_intercept),
-                                        np.array(gamma_r2),
-                                        np.array(gamma_logLL),
-                                    )
-
-                                    res2 = pool.starmap(
-                                        one_shot_gamma_alpha,
-                                        zip(gamma_k, itertools.repeat(t_uniq), U),
-                                    )
-
-                                    (gamma, alpha) = zip(*res2)
-                                    (gamma, self.parameters["alpha"]) = (
-                                        np.array(gamma),
-                                        np.array(alpha),
-                                    )
-
-                                    pool.close()
-                                    pool.join()
-                                (
-                                    self.parameters["gamma"],
-                                    self.aux_param["gamma_k"],
-                                    self.aux_param["gamma_intercept"],
-                                    self.aux_param["gamma_r2"],
-                                    self.aux_param["gamma_logLL"],
-                                    self.aux_param["alpha_r2"],
-                                ) = (
-                                    gamma,
-                                    gamma_k,
-                                    gamma_intercept,
-                                    gamma_r2,
-                                    gamma_logLL,
-                                    gamma_r2,
-                                )
-                elif self.model.lower() == "stochastic":
-                    if np.all(self._exist_data("uu", "ul", "su", "sl")):
-                        self.parameters["beta"] = np.ones(n_genes)
-                        k, k_intercept, k_r2, k_logLL, bs, bf = (
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                        )
-                        U = self.data["uu"]
-                        S = self.data["uu"] + self.data["ul"]
-                        US = (
-                            self.data["us"]
-                            if self.data["us"] is not None
-                            else calc_2nd_moment(U.T, S.T, self.conn, mX=U.T, mY=S.T).T
-                        )
-                        S2 = (
-                            self.data["s2"]
-                            if self.data["s2"] is not None
-                            else calc_2nd_moment(S.T, S.T, self.conn, mX=S.T, mY=S.T).T
-                        )
-                        if cores == 1:
-                            for i in tqdm(
-                                range(n_genes),
-                                desc="estimating beta and alpha for one-shot experiment",
-                            ):
-                                (
-                                    k[i],
-                                    k_intercept[i],
-                                    _,
-                                    k_r2[i],
-                                    _,
-                                    k_logLL[i],
-                                    bs[i],
-                                    bf[i],
-                                ) = self.fit_gamma_stochastic(
-                                    self.est_method,
-                                    U[i],
-                                    S[i],
-                                    US[i],
-                                    S2[i],
-                                    perc_left=perc_left,
-                                    perc_right=perc_right,
-                                    normalize=True,
-                                )
-                            else:
-                                pool = ThreadPool(cores)
-                                res = pool.starmap(
-                                    self.fit_gamma_stochastic,
-                                    zip(
-                                        itertools.repeat(self.est_method),
-                                        U,
-                                        S,
-                                        US,
-                                        S2,
-                                        itertools.repeat(perc_left),
-                                        itertools.repeat(perc_right),
-                                        itertools.repeat(True),
-                                    ),
-                                )
-                                pool.close()
-                                pool.join()
-                                (
-                                    k,
-                                    k_intercept,
-                                    _,
-                                    k_r2,
-                                    _,
-                                    k_logLL,
-                                    bs,
-                                    bf,
-                                ) = zip(*res)
-                                (k, k_intercept, k_r2, k_logLL, bs, bf) = (
-                                    np.array(k),
-                                    np.array(k_intercept),
-                                    np.array(k_r2),
-                                    np.array(k_logLL),
-                                    np.array(bs),
-                                    np.array(bf),
-                                )
-                        beta, alpha0 = one_shot_gamma_alpha_matrix(k, t_uniq, U)
-
-                        self.parameters["beta"], self.aux_param["beta_k"] = (
-                            beta,
-                            k,
-                        )
-
-                        U = self.data["uu"] + self.data["ul"]
-                        S = U + self.data["su"] + self.data["sl"]
-                        US = (
-                            self.data["us"]
-                            if self.data["us"] is not None
-                            else calc_2nd_moment(U.T, S.T, self.conn, mX=U.T, mY=S.T).T
-                        )
-                        S2 = (
-                            self.data["s2"]
-                            if self.data["s2"] is not None
-                            else calc_2nd_moment(S.T, S.T, self.conn, mX=S.T, mY=S.T).T
-                        )
-                        if cores == 1:
-                            for i in tqdm(
-                                range(n_genes),
-                                desc="estimating gamma and alpha for one-shot experiment",
-                            ):
-                                (
-                                    k[i],
-                                    k_intercept[i],
-                                    _,
-                                    k_r2[i],
-                                    _,
-                                    k_logLL[i],
-                                    bs[i],
-                                    bf[i],
-                                ) = self.fit_gamma_stochastic(
-                                    self.est_method,
-                                    U[i],
-                                    S[i],
-                                    US[i],
-                                    S2[i],
-                                    perc_left=perc_left,
-                                    perc_right=perc_right,
-                                    normalize=True,
-                                )
-                        else:
-                            pool = ThreadPool(cores)
-                            res = pool.starmap(
-                                self.fit_gamma_stochastic,
-                                zip(
-                                    itertools.repeat(self.est_method),
-                                    U,
-                                    S,
-                                    US,
-                                    S2,
-                                    itertools.repeat(perc_left),
-                                    itertools.repeat(perc_right),
-                                    itertools.repeat(True),
-                                ),
-                            )
-                            pool.close()
-                            pool.join()
-                            (k, k_intercept, _, k_r2, _, k_logLL, bs, bf) = zip(*res)
-                            (k, k_intercept, k_r2, k_logLL, bs, bf) = (
-                                np.array(k),
-                                np.array(k_intercept),
-                                np.array(k_r2),
-                                np.array(k_logLL),
-                                np.array(bs),
-                                np.array(bf),
-                            )
-
-                        gamma, alpha = one_shot_gamma_alpha_matrix(k, t_uniq, U)
-                        (
-                            self.parameters["alpha"],
-                            self.parameters["gamma"],
-                            self.aux_param["gamma_k"],
-                            self.aux_param["gamma_intercept"],
-                            self.aux_param["gamma_r2"],
-                            self.aux_param["gamma_logLL"],
-                            self.aux_param["bs"],
-                            self.aux_param["bf"],
-                        ) = (
-                            (alpha + alpha0) / 2,
-                            gamma,
-                            k,
-                            k_intercept,
-                            k_r2,
-                            k_logLL,
-                            bs,
-                            bf,
-                        )
-                    elif np.all(self._exist_data("uu", "ul")):
-                        k, k_intercept, k_r2, k_logLL, bs, bf = (
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                            np.zeros(n_genes),
-                        )
-                        U = self.data["ul"]
-                        S = self.data["ul"] + self.data["uu"]
-                        US = (
-                            self.data["us"]
-                            if self.data["us"] is not None
-                            else calc_2nd_moment(U.T, S.T, self.conn, mX=U.T, mY=S.T).T
-                        )
-                        S2 = (
-                            self.data["s2"]
-                            if self.data["s2"] is not None
-                            else calc_2nd_moment(S.T, S.T, self.conn, mX=S.T, mY=S.T).T
-                        )
-                        if cores == 1:
-                            for i in tqdm(range(n_genes), desc="estimating gamma"):
-                                (
-                                    k[i],
-                                    k_intercept[i],
-                                    _,
-                                    k_r2[i],
-                                    _,
-                                    k_logLL[i],
-                                    bs[i],
-                                    bf[i],
-                                ) = self.fit_gamma_stochastic(
-                                    self.est_method,
-                                    U[i],
-                                    S[i],
-                                    US[i],
-                                    S2[i],
-                                    perc_left=perc_left,
-                                    perc_right=perc_right,
-                                    normalize=True,
-                                )
-                        else:
-                            pool = ThreadPool(cores)
-                            res = pool.starmap(
-                                self.fit_gamma_stochastic,
-                                zip(
-                                    itertools.repeat(self.est_method),
-                                    U,
-                                    S,
-                                    US,
-                                    S2,
-                                    itertools.repeat(perc_left),
-                                    itertools.repeat(perc_right),
-                                    itertools.repeat(True),
-                                ),
-                            )
-                            pool.close()
-                            pool.join()
-                            (k, k_intercept, _, k_r2, _, k_logLL, bs, bf) = zip(*res)
-                            (k, k_intercept, k_r2, k_logLL, bs, bf) = (
-                                np.array(k),
-                                np.array(k_intercept),
-                                np.array(k_r2),
-                                np.array(k_logLL),
-                                np.array(bs),
-                                np.array(bf),
-                            )
-
-                        gamma, alpha = one_shot_gamma_alpha_matrix(k, t_uniq, U)
-                        (
-                            self.parameters["alpha"],
-                            self.parameters["gamma"],
-                            self.aux_param["gamma_k"],
-                            self.aux_param["gamma_intercept"],
-                            self.aux_param["gamma_r2"],
-                            self.aux_param["gamma_logLL"],
-                            self.aux_param["bs"],
-                            self.aux_param["bf"],
-                        ) = (
-                            alpha,
-                            gamma,
-                            k,
-                            k_intercept,
-                            k_r2,
-                            k_logLL,
-                            bs,
-                            bf,
-                        )
-            elif self.extyp.lower() == "mix_std_stm":
-                t_min, t_max = np.min(self.t), np.max(self.t)
-                if np.all(self._exist_data("ul", "uu", "su")):
-                    gamma, beta, total, U = (
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                        np.zeros(n_genes),
-                    )
-                    for i in tqdm(
-                        range(n_genes), desc="solving gamma/beta"
-                    ):  # can also use the two extreme time points and apply sci-fate like approach.
-                        tmp = (
-                            self.data["uu"][i, self.t == t_max]
-                            + self.data["ul"][i, self.t == t_max]
-                            + self.data["su"][i, self.t == t_max]
-                            + self.data["sl"][i, self.t == t_max]
-                        )
-                        total[i] = np.mean(tmp)
-                        gamma[i] = solve_gamma(
-                            t_max,
-                            self.data["uu"][i, self.t == t_max] + self.data["su"][i, self.t == t_max],
-                            tmp,
-                        )
-                        # same for beta
-                        tmp = self.data["uu"][i, self.t == t_max] + self.data["ul"][i, self.t == t_max]
-                        U[i] = np.mean(tmp)
-                        beta[i] = solve_gamma(
-                            np.max(self.t),
-                            self.data["uu"][i, self.t == t_max],
-                            tmp,
-                        )
-
-                    (
-                        self.parameters["beta"],
-                        self.parameters["gamma"],
-                        self.aux_param["total0"],
-                        self.aux_param["U0"],
-                    ) = (beta, gamma, total, U)
-                    # alpha estimation
-                    self.parameters["alpha"] = self.solve_alpha_mix_std_stm(
-                        self.t, self.data["ul"], self.parameters["beta"]
-                    )
-                elif np.all(self._exist_data("ul", "uu")):
-                    n_genes = self.data["uu"].shape[0]  # self.get_n_genes(data=U)
-                    gamma, U = np.zeros(n_genes), np.zeros(n_genes)
-                    for i in tqdm(
-                        range(n_genes), desc="solving gamma, alpha"
-                    ):  # apply sci-fate like approach (can also use one-single time point to estimate gamma)
-                        # tmp = self.data['uu'][i, self.t == 0] + self.data['ul'][i, self.t == 0]
-                        tmp_ = self.data["uu"][i, self.t == t_max] + self.data["ul"][i, self.t == t_max]
-
-                        U[i] = np.mean(tmp_)
-                        # gamma_1 = solve_gamma(np.max(self.t), self.data['uu'][i, self.t == 0], tmp) # steady state
-                        gamma_2 = solve_gamma(t_max, self.data["uu"][i, self.t == t_max], tmp_)  # stimulation
-                        # gamma_3 = solve_gamma(np.max(self.t), self.data['uu'][i, self.t == np.max(self.t)], tmp) # sci-fate
-                        gamma[i] = gamma_2
-                        # print('Steady state, stimulation, sci-fate like gamma values are ', gamma_1, '; ', gamma_2, '; ', gamma_3)
-                    (self.parameters["gamma"], self.aux_param["U0"], self.parameters["beta"],) = (
-                        gamma,
-                        U,
-                        np.ones(gamma.shape),
-                    )
-                    # alpha estimation
-                    self.parameters["alpha"] = self.solve_alpha_mix_std_stm(
-                        self.t, self.data["ul"], self.parameters["gamma"]
-                    )
+        self._compute_t_cache()
+        # genes are accessed row by row (or in blocks of rows) during the estimation, which is only cheap for csr
+        for key, X in self.data.items():
+            if issparse(X) and X.format != "csr":
+                self.data[key] = X.tocsr()
+        # fit mRNA with the routine of the experiment type, picked once instead of walking the whole branch tree
+        fit_mRNA = {
+            "conventional": self._fit_conventional,
+            "kin": self._fit_conventional,
+            "deg": self._fit_deg,
+            "one-shot": self._fit_one_shot,
+            "mix_std_stm": self._fit_mix_std_stm,
+        }.get(self.extyp.lower())
+        if fit_mRNA is not None:
+            fit_mRNA(intercept, perc_left, perc_right, clusters, one_shot_method)
 
         # fit protein
         if np.all(self._exist_data("p", "su")):
-            ind_for_proteins = self.ind_for_proteins
-            n_genes = len(ind_for_proteins) if ind_for_proteins is not None else 0
-
-            if self.asspt_prot.lower() == "ss" and n_genes > 0:
-                self.parameters["eta"] = np.ones(n_genes)
-                (delta, delta_intercept, delta_r2, delta_logLL,) = (
-                    np.zeros(n_genes),
-                    np.zeros(n_genes),
-                    np.zeros(n_genes),
-                    np.zeros(n_genes),
+            self._fit_protein(intercept, perc_left, perc_right)
+
+    def _second_moments(self, U, S):
+        """The second moments of U/S and S, taken from the data if given and computed with `self.conn` otherwise."""
+        US = self.data["us"] if self.data["us"] is not None else calc_2nd_moment(U.T, S.T, self.conn, mX=U.T, mY=S.T).T
+        S2 = self.data["s2"] if self.data["s2"] is not None else calc_2nd_moment(S.T, S.T, self.conn, mX=S.T, mY=S.T).T
+        return US, S2
+
+    def _fit_conventional(self, intercept, perc_left, perc_right, clusters=None, one_shot_method=None):
+        """Fit gamma of conventional (or kinetic data treated as conventional) experiments with the steady state
+        assumption."""
+        if np.all(self._exist_data("uu", "su")):
+            U = self.data["uu"] if self.data["ul"] is None else self.data["uu"] + self.data["ul"]
+            S = self.data["su"] if self.data["sl"] is None else self.data["su"] + self.data["sl"]
+        elif np.all(self._exist_data("uu", "ul")):
+            U = self.data["ul"]
+            S = self.data["uu"] + self.data["ul"]
+        else:
+            return
+
+        if self.model.lower() == "deterministic":
+            self.parameters["beta"] = np.ones(self.get_n_genes())
+            (
+                self.parameters["gamma"],
+                self.aux_param["gamma_intercept"],
+                _,
+                self.aux_param["gamma_r2"],
+                _,
+                self.aux_param["gamma_logLL"],
+            ) = self.fit_gamma_steady_state_batch(U, S, intercept, perc_left, perc_right)
+        elif self.model.lower() == "stochastic":
+            self.parameters["beta"] = np.ones(self.get_n_genes())
+            US, S2 = self._second_moments(U, S)
+            (
+                self.parameters["gamma"],
+                self.aux_param["gamma_intercept"],
+                _,
+                self.aux_param["gamma_r2"],
+                _,
+                self.aux_param["gamma_logLL"],
+                self.aux_param["bs"],
+                self.aux_param["bf"],
+            ) = self.fit_gamma_stochastic_batch(
+                self.est_method,
+                U,
+                S,
+                US,
+                S2,
+                perc_left=perc_left,
+                perc_right=perc_right,
+                normalize=True,
+            )
+
+    def _fit_deg(self, intercept, perc_left, perc_right, clusters=None, one_shot_method=None):
+        """Fit the parameters of degradation experiments from the mean of each time point."""
+        if np.all(self._exist_data("ul", "sl")):
+            # beta & gamma estimation
+            ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
+            sl_m, sl_v, _ = calc_12_mom_labeling(self.data["sl"], self.t)
+            (
+                self.parameters["beta"],
+                self.parameters["gamma"],
+                self.aux_param["ul0"],
+                self.aux_param["sl0"],
+            ) = self.fit_beta_gamma_lsq(t_uniq, ul_m, sl_m)
+            if self._exist_data("uu"):
+                # alpha estimation
+                uu_m, uu_v, _ = calc_12_mom_labeling(self.data["uu"], self.t)
+                alpha, uu0, r2 = fit_alpha_degradation_batch(
+                    t_uniq,
+                    uu_m,
+                    self.parameters["beta"],
+                    intercept=True,
                 )
+                (
+                    self.parameters["alpha"],
+                    self.aux_param["alpha_intercept"],
+                    self.aux_param["uu0"],
+                    self.aux_param["alpha_r2"],
+                ) = (alpha[:, None], uu0, uu0, r2)
+        elif self._exist_data("ul"):
+            # gamma estimation
+            # use mean + var for fitting degradation parameter k
+            ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
+            (
+                self.parameters["gamma"],
+                self.aux_param["ul0"],
+            ) = self.fit_gamma_nosplicing_lsq(t_uniq, ul_m)
+            if self._exist_data("uu"):
+                # alpha estimation
+                uu_m, uu_v, _ = calc_12_mom_labeling(self.data["uu"], self.t)
+                alpha, alpha_b, alpha_r2 = fit_alpha_degradation_batch(
+                    t_uniq,
+                    uu_m,
+                    self.parameters["gamma"],
+                    intercept=True,
+                )
+                (
+                    self.parameters["alpha"],
+                    self.aux_param["alpha_intercept"],
+                    self.aux_param["uu0"],
+                    self.aux_param["alpha_r2"],
+                ) = (alpha, alpha_b, alpha_b, alpha_r2)
+
+    def _fit_multi_time_synthesis(self):
+        """Fit the parameters of labeling experiments with at least two time points from the mean of each time
+        point."""
+        if np.all(self._exist_data("ul", "uu", "su")):
+            if not self._exist_parameter("beta"):
+                warn("beta & gamma estimation: only works when there're at least 2 time points.")
+                uu_m, uu_v, t_uniq = calc_12_mom_labeling(self.data["uu"], self.t)
+                su_m, su_v, _ = calc_12_mom_labeling(self.data["su"], self.t)
 
-                s = (
-                    self.data["su"][ind_for_proteins] + self.data["sl"][ind_for_proteins]
-                    if self._exist_data("sl")
-                    else self.data["su"][ind_for_proteins]
+                (
+                    self.parameters["beta"],
+                    self.parameters["gamma"],
+                    self.aux_param["uu0"],
+                    self.aux_param["su0"],
+                ) = self.fit_beta_gamma_lsq(t_uniq, uu_m, su_m)
+            # alpha estimation
+            ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
+            # let us only assume one alpha for each gene in all cells
+            alpha = fit_alpha_synthesis_batch(t_uniq, ul_m, self.parameters["beta"])
+            self.parameters["alpha"] = alpha
+        elif np.all(self._exist_data("ul", "uu")):
+            uu_m, uu_v, t_uniq = calc_12_mom_labeling(self.data["uu"], self.t)
+            gamma, u0 = fit_first_order_deg_lsq_batch(t_uniq, uu_m)
+            invalid = ~np.isfinite(gamma)
+            gamma[invalid], u0[invalid] = 0, 0
+            self.parameters["gamma"], self.aux_param["uu0"] = gamma, u0
+            # let us only assume one alpha for each gene in all cells
+            ul_m, ul_v, _ = calc_12_mom_labeling(self.data["ul"], self.t)
+            alpha = fit_alpha_synthesis_batch(t_uniq, ul_m, self.parameters["gamma"])
+            self.parameters["alpha"] = alpha
+
+    def _fit_one_shot(self, intercept, perc_left, perc_right, clusters=None, one_shot_method="combined"):
+        """Fit the parameters of one-shot experiments; with more than one time point the data is fitted as a kinetic
+        experiment."""
+        if len(self._t_uniq) > 1:
+            self._fit_multi_time_synthesis()
+        elif self.model.lower() == "deterministic":
+            self._fit_one_shot_deterministic(perc_right, clusters, one_shot_method)
+        elif self.model.lower() == "stochastic":
+            self._fit_one_shot_stochastic(perc_left, perc_right)
+
+    def _fit_one_shot_deterministic(self, perc_right, clusters, one_shot_method):
+        # calculate when having splicing or no splicing
+        if np.all(self._exist_data("ul", "uu", "su")):
+            if self._exist_parameter("beta", "gamma").all():
+                self.parameters["alpha"] = self.fit_alpha_oneshot(
+                    self.t,
+                    self.data["ul"],
+                    self.parameters["beta"],
+                    clusters,
                 )
-                if cores == 1:
-                    for i in tqdm(range(n_genes), desc="estimating delta"):
-                        (
-                            delta[i],
-                            delta_intercept[i],
-                            _,
-                            delta_r2[i],
-                            _,
-                            delta_logLL[i],
-                        ) = self.fit_gamma_steady_state(
-                            s[i],
-                            self.data["p"][i],
-                            intercept,
-                            perc_left,
-                            perc_right,
-                        )
-                else:
-                    pool = ThreadPool(cores)
-                    res = pool.starmap(
-                        self.fit_gamma_steady_state,
-                        zip(
-                            s,
-                            self.data["p"],
-                            itertools.repeat(intercept),
-                            itertools.repeat(perc_left),
-                            itertools.repeat(perc_right),
-                        ),
-                    )
-                    pool.close()
-                    pool.join()
-                    (delta, delta_intercept, _, delta_r2, _, delta_logLL) = zip(*res)
-                    (delta, delta_intercept, delta_r2, delta_logLL) = (
-                        np.array(delta),
-                        np.array(delta_intercept),
-                        np.array(delta_r2),
-                        np.array(delta_logLL),
-                    )
+            else:
+                # can also use the two extreme time points and apply sci-fate like approach.
+                t_max = self._t_max
+                # the means of the layers add up to those of the total RNA, which is never formed
+                uu, ul, su, sl = [row_means(self.data[key]) for key in ["uu", "ul", "su", "sl"]]
+                U0, S0 = uu + ul, su + sl
+                beta, gamma = solve_gamma_mean(t_max, uu, U0), solve_gamma_mean(t_max, su, S0)
                 (
-                    self.parameters["delta"],
-                    self.aux_param["delta_intercept"],
-                    self.aux_param["delta_r2"],
-                    _,  # self.aux_param["delta_logLL"],
-                ) = (delta, delta_intercept, delta_r2, delta_logLL)
+                    self.aux_param["U0"],
+                    self.aux_param["S0"],
+                    self.parameters["beta"],
+                    self.parameters["gamma"],
+                ) = (U0, S0, beta, gamma)
+
+                ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
+                # let us only assume one alpha for each gene in all cells
+                alpha = fit_alpha_synthesis_batch(t_uniq, ul_m, self.parameters["beta"])
+                self.parameters["alpha"] = alpha
+                # self.parameters['alpha'] = self.fit_alpha_oneshot(self.t, self.data['ul'], self.parameters['beta'], clusters)
+        elif self._exist_data("ul") and self._exist_parameter("gamma"):
+            self.parameters["alpha"] = self.fit_alpha_oneshot(
+                self.t,
+                self.data["ul"],
+                self.parameters["gamma"],
+                clusters,
+            )
+        elif self._exist_data("ul") and self._exist_data("uu"):
+            if one_shot_method in ["sci-fate", "sci_fate"]:
+                self._fit_one_shot_sci_fate()
+            elif one_shot_method == "combined":
+                self._fit_one_shot_combined(perc_right)
+
+    def _fit_one_shot_sci_fate(self):
+        uu = row_means(self.data["uu"])
+        total0 = uu + row_means(self.data["ul"])
+        gamma = solve_gamma_mean(self._t_max, uu, total0)
+        (self.aux_param["total0"], self.parameters["gamma"],) = (
+            total0,
+            gamma,
+        )
+
+        ul_m, ul_v, t_uniq = calc_12_mom_labeling(self.data["ul"], self.t)
+        # let us only assume one alpha for each gene in all cells
+        alpha = fit_alpha_synthesis_batch(t_uniq, ul_m, self.parameters["gamma"])
+        self.parameters["alpha"] = alpha
+        # self.parameters['alpha'] = self.fit_alpha_oneshot(self.t, self.data['ul'], self.parameters['gamma'], clusters)
+
+    def _fit_one_shot_combined(self, perc_right):
+        U, S = (
+            self.data["ul"],
+            self.data["uu"] + self.data["ul"],
+        )
+
+        (
+            gamma_k,
+            gamma_intercept,
+            _,
+            gamma_r2,
+            _,
+            gamma_logLL,
+        ) = self.fit_gamma_steady_state_batch(U, S, False, None, perc_right)
+        # `one_shot_gamma_alpha` for all genes at once: alpha is built in one go as U scaled
+        # by gamma / k of each gene instead of being assigned into a preallocated matrix row by
+        # row
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gamma = -np.log(1 - gamma_k) / self._t_uniq[0]
+            scale = (gamma / gamma_k)[:, None]
+        self.parameters["alpha"] = U.multiply(scale).tocsr() if issparse(U) else U * scale
+        (
+            self.parameters["gamma"],
+            self.aux_param["gamma_k"],
+            self.aux_param["gamma_intercept"],
+            self.aux_param["gamma_r2"],
+            self.aux_param["gamma_logLL"],
+            self.aux_param["alpha_r2"],
+        ) = (
+            gamma,
+            gamma_k,
+            gamma_intercept,
+            gamma_r2,
+            gamma_logLL,
+            gamma_r2,
+        )
+
+    def _fit_one_shot_stochastic(self, perc_left, perc_right):
+        t_uniq = self._t_uniq
+        if np.all(self._exist_data("uu", "ul", "su", "sl")):
+            self.parameters["beta"] = np.ones(self.get_n_genes())
+            U = self.data["uu"]
+            S = self.data["uu"] + self.data["ul"]
+            US, S2 = self._second_moments(U, S)
+            (
+                k,
+                k_intercept,
+                _,
+                k_r2,
+                _,
+                k_logLL,
+                bs,
+                bf,
+            ) = self.fit_gamma_stochastic_batch(
+                self.est_method,
+                U,
+                S,
+                US,
+                S2,
+                perc_left=perc_left,
+                perc_right=perc_right,
+                normalize=True,
+            )
+            beta, alpha0 = one_shot_gamma_alpha_matrix(k, t_uniq, U)
+
+            self.parameters["beta"], self.aux_param["beta_k"] = (
+                beta,
+                k,
+            )
+
+            U = self.data["uu"] + self.data["ul"]
+            S = U + self.data["su"] + self.data["sl"]
+            US, S2 = self._second_moments(U, S)
+            (
+                k,
+                k_intercept,
+                _,
+                k_r2,
+                _,
+                k_logLL,
+                bs,
+                bf,
+            ) = self.fit_gamma_stochastic_batch(
+                self.est_method,
+                U,
+                S,
+                US,
+                S2,
+                perc_left=perc_left,
+                perc_right=perc_right,
+                normalize=True,
+            )
+
+            gamma, alpha = one_shot_gamma_alpha_matrix(k, t_uniq, U)
+            (
+                self.parameters["alpha"],
+                self.parameters["gamma"],
+                self.aux_param["gamma_k"],
+                self.aux_param["gamma_intercept"],
+                self.aux_param["gamma_r2"],
+                self.aux_param["gamma_logLL"],
+                self.aux_param["bs"],
+                self.aux_param["bf"],
+            ) = (
+                (alpha + alpha0) / 2,
+                gamma,
+                k,
+                k_intercept,
+                k_r2,
+                k_logLL,
+                bs,
+                bf,
+            )
+        elif np.all(self._exist_data("uu", "ul")):
+            U = self.data["ul"]
+            S = self.data["ul"] + self.data["uu"]
+            US, S2 = self._second_moments(U, S)
+            (
+                k,
+                k_intercept,
+                _,
+                k_r2,
+                _,
+                k_logLL,
+                bs,
+                bf,
+            ) = self.fit_gamma_stochastic_batch(
+                self.est_method,
+                U,
+                S,
+                US,
+                S2,
+                perc_left=perc_left,
+                perc_right=perc_right,
+                normalize=True,
+            )
+
+            gamma, alpha = one_shot_gamma_alpha_matrix(k, t_uniq, U)
+            (
+                self.parameters["alpha"],
+                self.parameters["gamma"],
+                self.aux_param["gamma_k"],
+                self.aux_param["gamma_intercept"],
+                self.aux_param["gamma_r2"],
+                self.aux_param["gamma_logLL"],
+                self.aux_param["bs"],
+                self.aux_param["bf"],
+            ) = (
+                alpha,
+                gamma,
+                k,
+                k_intercept,
+                k_r2,
+                k_logLL,
+                bs,
+                bf,
+            )
+
+    def _fit_mix_std_stm(self, intercept, perc_left, perc_right, clusters=None, one_shot_method=None):
+        """Fit the parameters of mixed steady state and stimulation labeling experiments."""
+        # the cells of the last time point, selected once for all genes
+        t_max, cells = self._t_max, self._t_groups[-1]
+        if np.all(self._exist_data("ul", "uu", "su")):
+            # can also use the two extreme time points and apply sci-fate like approach.
+            uu, ul, su, sl = [row_means(self.data[key][:, cells]) for key in ["uu", "ul", "su", "sl"]]
+            total = uu + ul + su + sl
+            gamma = solve_gamma_mean(t_max, uu + su, total)
+            # same for beta
+            U = uu + ul
+            beta = solve_gamma_mean(t_max, uu, U)
+
+            (
+                self.parameters["beta"],
+                self.parameters["gamma"],
+                self.aux_param["total0"],
+                self.aux_param["U0"],
+            ) = (beta, gamma, total, U)
+            # alpha estimation
+            self.parameters["alpha"] = self.solve_alpha_mix_std_stm(self.t, self.data["ul"], self.parameters["beta"])
+        elif np.all(self._exist_data("ul", "uu")):
+            # apply sci-fate like approach (can also use one-single time point to estimate gamma)
+            uu = row_means(self.data["uu"][:, cells])
+            U = uu + row_means(self.data["ul"][:, cells])
+            gamma_2 = solve_gamma_mean(t_max, uu, U)  # stimulation
+            gamma = gamma_2
+            (self.parameters["gamma"], self.aux_param["U0"], self.parameters["beta"],) = (
+                gamma,
+                U,
+                np.ones(gamma.shape),
+            )
+            # alpha estimation
+            self.parameters["alpha"] = self.solve_alpha_mix_std_stm(self.t, self.data["ul"], self.parameters["gamma"])
+
+    def _fit_protein(self, intercept, perc_left, perc_right):
+        """Fit delta of the genes with protein measurements with the steady state assumption."""
+        ind_for_proteins = self.ind_for_proteins
+        n_genes = len(ind_for_proteins) if ind_for_proteins is not None else 0
+
+        if self.asspt_prot.lower() == "ss" and n_genes > 0:
+            self.parameters["eta"] = np.ones(n_genes)
+
+            s = self.data["su"][ind_for_proteins]
+            if self._exist_data("sl"):
+                s = s + self.data["sl"][ind_for_proteins]
+            (delta, delta_intercept, _, delta_r2, _, delta_logLL) = self.fit_gamma_steady_state_batch(
+                s, self.data["p"], intercept, perc_left, perc_right
+            )
+            (
+                self.parameters["delta"],
+                self.aux_param["delta_intercept"],
+                self.aux_param["delta_r2"],
+                _,  # self.aux_param["delta_logLL"],
+            ) = (delta, delta_intercept, delta_r2, delta_logLL)
 
     def fit_gamma_steady_state(self, u, s, intercept=True, perc_left=None, perc_right=5, normalize=True):
         """Estimate gamma using linear regression based on the steady state assumption.
@@ -1592,6 +1215,16 @@ class ss_estimation:
         u = u.A.flatten() if issparse(u) else u.flatten()
         s = s.A.flatten() if issparse(s) else s.flatten()
 
+        if self.est_method.lower() == "ols":
+            return steady_state_linreg(
+                s.astype(np.float64),
+                u.astype(np.float64),
+                -1.0 if perc_left is None else float(perc_left),
+                -1.0 if perc_right is None else float(perc_right),
+                bool(normalize),
+                bool(intercept),
+            )
+
         mask = find_extreme(
             s,
             u,
@@ -1599,11 +1232,7 @@ class ss_estimation:
             perc_left=perc_left,
             perc_right=perc_right,
         )
-
-        if self.est_method.lower() == "ols":
-            k, b, r2, all_r2 = fit_linreg(s, u, mask, intercept)
-        else:
-            k, b, r2, all_r2 = fit_linreg_robust(s, u, mask, intercept, self.est_method)
+        k, b, r2, all_r2 = fit_linreg_robust(s, u, mask, intercept, self.est_method)
 
         logLL, all_logLL = (
             calc_norm_loglikelihood(s[mask], u[mask], k),
@@ -1692,14 +1321,188 @@ class ss_estimation:
             k = fit_k_negative_binomial(u[mask], s[mask], ss[mask], phi)
             bs, bf = compute_bursting_properties(np.mean(u[mask] + s[mask]), phi, k)
 
-        r2, all_r2 = calc_R2(s[mask], u[mask], k), calc_R2(s, u, k)
-        logLL, all_logLL = (
-            calc_norm_loglikelihood(s[mask], u[mask], k),
-            calc_norm_loglikelihood(s, u, k),
-        )
+        # r square and log likelihood share one set of sums instead of taking one pass over the residuals each
+        k_ = np.array([k], dtype=float)
+        (r2,), (logLL,) = calc_R2_loglikelihood_batch(s[None], u[None], k_, mask[None])
+        (all_r2,), (all_logLL,) = calc_R2_loglikelihood_batch(s[None], u[None], k_)
 
         return (k, 0, r2, all_r2, logLL, all_logLL, bs, bf)
 
+    def fit_gamma_steady_state_batch(self, U, S, intercept=True, perc_left=None, perc_right=5, normalize=True):
+        """Estimate gamma of all genes using linear regression based on the steady state assumption. This is the
+        vectorized version of `fit_gamma_steady_state`: genes are fitted in blocks of rows so that only one block of a
+        sparse matrix is densified at a time. Robust linear regression methods fall back to the per-gene estimation.
+
+        Arguments
+        ---------
+            U: :class:`~numpy.ndarray` or sparse `csr_matrix`
+                A matrix of unspliced mRNA counts. Dimension: genes x cells.
+            S: :class:`~numpy.ndarray` or sparse `csr_matrix`
+                A matrix of spliced mRNA counts. Dimension: genes x cells.
+            intercept: bool
+                If using steady state assumption for fitting, then:
+                True -- the linear regression is performed with an unfixed intercept;
+                False -- the linear regresssion is performed with a fixed zero intercept.
+            perc_left: float
+                The percentage of samples included in the linear regression in the left tail. If set to None, then all the
+                left samples are excluded.
+            perc_right: float
+                The percentage of samples included in the linear regression in the right tail. If set to None, then all the
+                samples are included.
+            normalize: bool
+                Whether to first normalize the data.
+
+        Returns
+        -------
+            k, b, r2, all_r2, logLL, all_logLL: :class:`~numpy.ndarray`
+                The per-gene outputs of `fit_gamma_steady_state`, stacked into vectors.
+        """
+        if self.est_method.lower() != "ols":
+            return self._fit_genewise(
+                lambda u, s: self.fit_gamma_steady_state(u, s, intercept, perc_left, perc_right, normalize),
+                U,
+                S,
+                desc="estimating gamma",
+            )
+
+        if intercept and perc_left is None:
+            perc_left = perc_right
+        U, S = [X.tocsr() if issparse(X) else X for X in (U, S)]
+        sparse = issparse(U) and issparse(S)
+        n_genes, n_cells = U.shape
+        res = np.zeros((6, n_genes))
+        for start, stop in get_row_blocks(n_genes, n_cells):
+            u, s = dense_rows(U, start, stop), dense_rows(S, start, stop)
+            if not sparse:
+                res[:, start:stop] = steady_state_linreg_batch(
+                    s,
+                    u,
+                    -1.0 if perc_left is None else float(perc_left),
+                    -1.0 if perc_right is None else float(perc_right),
+                    bool(normalize),
+                    bool(intercept),
+                )
+                continue
+
+            mask = find_extreme_batch(
+                s,
+                u,
+                normalize=normalize,
+                perc_left=perc_left,
+                perc_right=perc_right,
+            )
+            # the statistics over all cells are computed from the sparse data below
+            k, b = fit_linreg_batch(s, u, mask, intercept, r2=False)
+            res[[0, 1], start:stop] = k, b
+            res[[2, 4], start:stop] = calc_R2_loglikelihood_batch(s, u, k, mask, b)
+
+        if sparse:
+            res[3], res[5] = calc_sparse_R2_loglikelihood(S, U, res[0], res[1])
+
+        return tuple(res)
+
+    def fit_gamma_stochastic_batch(
+        self,
+        est_method,
+        U,
+        S,
+        US,
+        SS,
+        perc_left=None,
+        perc_right=5,
+        normalize=True,
+    ):
+        """Estimate gamma of all genes using GMM (generalized method of moments) or negbin distrubtion based on the
+        steady state assumption. This is the vectorized version of `fit_gamma_stochastic`; the `negbin` method falls
+        back to the per-gene estimation.
+
+        Arguments
+        ---------
+            est_method: `str` {`gmm`, `negbin`}
+                The estimation method to be used when using the `stochastic` model.
+            U: :class:`~numpy.ndarray` or sparse `csr_matrix`
+                A matrix of unspliced mRNA counts. Dimension: genes x cells.
+            S: :class:`~numpy.ndarray` or sparse `csr_matrix`
+                A matrix of spliced mRNA counts. Dimension: genes x cells.
+            US: :class:`~numpy.ndarray` or sparse `csr_matrix`
+                A matrix of unspliced mRNA counts. Dimension: genes x cells.
+            SS: :class:`~numpy.ndarray` or sparse `csr_matrix`
+                A matrix of spliced mRNA counts. Dimension: genes x cells.
+            perc_left: float
+                The percentage of samples included in the linear regression in the left tail. If set to None, then all the left samples are excluded.
+            perc_right: float
+                The percentage of samples included in the linear regression in the right tail. If set to None, then all the samples are included.
+            normalize: bool
+                Whether to first normalize the data.
+
+        Returns
+        -------
+            k, b, r2, all_r2, logLL, all_logLL, bs, bf: :class:`~numpy.ndarray`
+                The per-gene outputs of `fit_gamma_stochastic`, stacked into vectors.
+        """
+        if est_method.lower() != "gmm":
+            return self._fit_genewise(
+                lambda u, s, us, ss: self.fit_gamma_stochastic(
+                    est_method, u, s, us, ss, perc_left, perc_right, normalize
+                ),
+                U,
+                S,
+                US,
+                SS,
+                desc="estimating gamma",
+            )
+
+        # the second moments are computed as cells x genes matrices and become csc after the transpose
+        U, S, US, SS = [X.tocsr() if issparse(X) else X for X in (U, S, US, SS)]
+        sparse = issparse(U) and issparse(S)
+        n_genes, n_cells = U.shape
+        res = np.zeros((8, n_genes))
+        res[6:] = np.nan  # bursting properties are only estimated by negbin
+        for start, stop in get_row_blocks(n_genes, n_cells):
+            u, s, us, ss = [dense_rows(X, start, stop) for X in (U, S, US, SS)]
+            mask = find_extreme_batch(
+                s,
+                u,
+                normalize=normalize,
+                perc_left=perc_left,
+                perc_right=perc_right,
+            )
+
+            k = fit_stochastic_linreg_batch(u, s, us, ss, mask)
+            res[0, start:stop] = k
+            res[[2, 4], start:stop] = calc_R2_loglikelihood_batch(s, u, k, mask)
+            if not sparse:
+                res[[3, 5], start:stop] = calc_R2_loglikelihood_batch(s, u, k)
+
+        if sparse:
+            # the statistics over all cells are computed from the sparse data directly
+            res[3], res[5] = calc_sparse_R2_loglikelihood(S, U, res[0])
+
+        return tuple(res)
+
+    def _fit_genewise(self, fit_func, *data, desc=None):
+        """Apply a per-gene fitting function to the rows of the data matrices, with `self.cores` threads, and stack each
+        of its outputs into a vector. The rows are taken from blocks of genes that are densified at once, instead of
+        slicing one sparse row object out of each matrix per gene."""
+        data = [X.tocsr() if issparse(X) else X for X in data]
+        (n_genes, n_cells), cores = data[0].shape, max(1, int(self.cores))
+        pool = ThreadPool(cores) if cores > 1 else None
+        res = []
+        # the progress bar is advanced once per block of genes rather than once per gene
+        with tqdm(total=n_genes, desc=desc) as pbar:
+            for start, stop in get_row_blocks(n_genes, n_cells):
+                rows = zip(*[dense_rows(X, start, stop) for X in data])
+                if pool is None:
+                    res.extend(fit_func(*row) for row in rows)
+                else:
+                    res.extend(pool.starmap(fit_func, rows))
+                pbar.update(stop - start)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        return tuple(np.array(r) for r in zip(*res))
+
     def fit_beta_gamma_lsq(self, t, U, S):
         """Estimate beta and gamma with the degradation data using the least squares method.
 
@@ -1723,17 +1526,9 @@ class ss_estimation:
             s0: float
                 Initial value of s.
         """
-        n = U.shape[0]  # self.get_n_genes(data=U)
-        beta = np.zeros(n)
-        gamma = np.zeros(n)
-        u0, s0 = np.zeros(n), np.zeros(n)
-
-        for i in tqdm(range(n), desc="estimating beta, gamma"):
-            beta[i], u0[i] = fit_first_order_deg_lsq(t, U[i])
-            if np.isfinite(u0[i]):
-                gamma[i], s0[i] = fit_gamma_lsq(t, S[i], beta[i], u0[i])
-            else:
-                gamma[i], s0[i] = np.nan, np.nan
+        beta, u0 = fit_first_order_deg_lsq_batch(t, U)
+        gamma, s0 = fit_gamma_lsq_batch(t, S, beta, u0)
+        gamma[~np.isfinite(u0)], s0[~np.isfinite(u0)] = np.nan, np.nan
         return beta, gamma, u0, s0
 
     def fit_gamma_nosplicing_lsq(self, t, L):
@@ -1753,12 +1548,7 @@ class ss_estimation:
             l0: float
                 The estimated value for the initial spliced, labeled mRNA count.
         """
-        n = L.shape[0]  # self.get_n_genes(data=L)
-        gamma = np.zeros(n)
-        l0 = np.zeros(n)
-
-        for i in tqdm(range(n), desc="estimating gamma"):
-            gamma[i], l0[i] = fit_first_order_deg_lsq(t, L[i].A[0]) if issparse(L) else fit_first_order_deg_lsq(t, L[i])
+        gamma, l0 = fit_first_order_deg_lsq_batch(t, L)
         return gamma, l0
 
     def solve_alpha_mix_std_stm(self, t, ul, beta, clusters=None, alpha_time_dependent=True):
@@ -1789,32 +1579,27 @@ class ss_estimation:
 
         # calculate alpha initial guess:
         t = np.array(t) if type(t) is list else t
-        t_std, t_stm, t_uniq, t_max, t_min = (
-            np.max(t) - t,
-            t,
-            np.unique(t),
-            np.max(t),
-            np.min(t),
-        )
+        (t_uniq, t_groups), t_max = group_by_time(t), np.max(t)
 
         alpha_std_ini = self.fit_alpha_oneshot(
-            np.array([t_max]), np.mean(ul[:, t == t_min], 1), beta, clusters
+            np.array([t_max]), np.mean(ul[:, t_groups[0]], 1), beta, clusters
         ).flatten()
-        alpha_std, alpha_stm = alpha_std_ini, np.zeros((ul.shape[0], len(t_uniq)))
+        alpha_std = alpha_std_ini
+        # solve_alpha_2p only needs the mean labeled RNA of each time point, so the cells of each time point are
+        # gathered once for all genes instead of once per gene
+        ul_mean = np.column_stack([row_means(ul[:, cells]) for cells in t_groups])
+
+        alpha_stm = np.zeros((ul.shape[0], len(t_uniq)))
         alpha_stm[:, 0] = alpha_std_ini  # 0 stimulation point is the steady state transcription
-        for i in tqdm(
-            range(ul.shape[0]),
-            desc="solving steady state alpha and induction alpha",
-        ):
-            l = ul[i].A.flatten() if issparse(ul) else ul[i]
-            for t_ind in np.arange(1, len(t_uniq)):
-                alpha_stm[i, t_ind] = solve_alpha_2p(
-                    t_max - t_uniq[t_ind],
-                    t_uniq[t_ind],
-                    alpha_std[i],
-                    beta[i],
-                    l[t == t_uniq[t_ind]],
-                )
+        if len(t_uniq) > 1:
+            t_uniq = np.asarray(t_uniq, dtype=np.float64)
+            alpha_stm[:, 1:] = solve_alpha_2p_batch(
+                t_max - t_uniq[1:],
+                t_uniq[1:],
+                np.asarray(alpha_std, dtype=np.float64).flatten(),
+                np.asarray(beta, dtype=np.float64).flatten(),
+                np.ascontiguousarray(ul_mean[:, 1:], dtype=np.float64),
+            )
         if not alpha_time_dependent:
             alpha_stm = alpha_stm.mean(1)
 
@@ -1839,21 +1624,21 @@ class ss_estimation:
             alpha: :class:`~numpy.ndarray`
                 A numpy array with the dimension of n_genes x clusters.
         """
-        n_genes, n_cells = U.shape
+        U = U.toarray() if issparse(U) else np.asarray(U)
+        U = U.reshape(len(U), -1)
+        n_genes = U.shape[0]
+        beta = np.asarray(beta, dtype=float).flatten()
+
+        # the closed form of `fit_alpha_synthesis`, beta * mean(u) / mean(1 - exp(-beta * t)), for all genes and
+        # clusters at once. Only the mean of u depends on the cluster.
+        x = np.mean(1 - np.exp(-beta[:, None] * np.asarray(t, dtype=float).flatten()[None, :]), 1)
         if clusters is None:
-            clusters = [[i] for i in range(n_cells)]
-        alpha = np.zeros((n_genes, len(clusters)))
-        for i, c in enumerate(clusters):
-            for j in tqdm(range(n_genes), desc="estimating alpha"):
-                if len(c) > 0:
-                    alpha[j, i] = (
-                        fit_alpha_synthesis(t, U[j].A[0][c], beta[j])
-                        if issparse(U)
-                        else fit_alpha_synthesis(t, U[j][c], beta[j])
-                    )
-                else:
-                    alpha[j, i] = np.nan
-        return alpha
+            u_mean = U
+        else:
+            u_mean = np.column_stack([U[:, c].mean(1) if len(c) > 0 else np.full(n_genes, np.nan) for c in clusters])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return beta[:, None] * u_mean / x[:, None]
 
     def concatenate_data(self):
         """Concatenate available data into a single matrix.
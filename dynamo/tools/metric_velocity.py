@@ -127,67 +127,24 @@ def cell_wise_confidence(
         # this is inspired from the locality preservation paper
         jac, intersect_, _ = jaccard(X, V, n_pca_components, n_neigh, X_neighbors)
 
+        # densify once instead of once per pair of neighboring cells
+        V = V.toarray() if issparse(V) else np.asarray(V)
+        intersect_ = csr_matrix(intersect_)
         confidence = np.zeros(adata.n_obs)
         for i in tqdm(
             range(adata.n_obs),
             desc="calculating hybrid method (jaccard + consensus) based cell wise confidence",
+            mininterval=0.5,
+            miniters=max(1, adata.n_obs // 100),
         ):
-            neigh_ids = np.where(intersect_[i].A)[0] if issparse(intersect_) else np.where(intersect_[i])[0]
-            confidence[i] = (
-                jac[i] * np.mean([consensus(V[i].A.flatten(), V[j].A.flatten()) for j in neigh_ids])
-                if issparse(V)
-                else jac[i] * np.mean([consensus(V[i].flatten(), V[j].flatten()) for j in neigh_ids])
-            )
-
-    elif method == "cosine":
-        check_and_recompute_neighbors(adata, result_prefix="")
-        indices = adata.uns["neighbors"]["indices"]
-        confidence = np.zeros(adata.n_obs)
-        for i in tqdm(
-            range(adata.n_obs),
-            desc="calculating cosine based cell wise confidence",
-        ):
-            neigh_ids = indices[i]
-            confidence[i] = (
-                np.mean([einsum_correlation(V[i].A, V[j].A.flatten(), type="cosine")[0, 0] for j in neigh_ids])
-                if issparse(V)
-                else np.mean(
-                    [einsum_correlation(V[i][None, :], V[j].flatten(), type="cosine")[0, 0] for j in neigh_ids]
-                )
-            )
-
-    elif method == "consensus":
-        check_and_recompute_neighbors(adata, result_prefix="")
-        indices = adata.uns["neighbors"]["indices"]
-        confidence = np.zeros(adata.n_obs)
-        for i in tqdm(
-            range(adata.n_obs),
-            desc="calculating consensus based cell wise confidence",
-        ):
-            neigh_ids = indices[i]
-            confidence[i] = (
-                np.mean([consensus(V[i].A.flatten(), V[j].A.flatten()) for j in neigh_ids])
-                if issparse(V)
-                else np.mean([consensus(V[i], V[j].flatten()) for j in neigh_ids])
-            )
+            neigh_ids = intersect_.indices[intersect_.indptr[i] : intersect_.indptr[i + 1]]
+            confidence[i] = jac[i] * np.mean([consensus(V[i], V[j]) for j in neigh_ids])
 
-    elif method == "correlation":
-        # this is equivalent to scVelo
+    elif method in ["cosine", "consensus", "correlation"]:
+        # correlation is equivalent to scVelo
         check_and_recompute_neighbors(adata, result_prefix="")
         indices = adata.uns["neighbors"]["indices"]
-        confidence = np.zeros(adata.n_obs)
-        for i in tqdm(
-            range(adata.n_obs),
-            desc="calculating correlation based cell wise confidence",
-        ):
-            neigh_ids = indices[i]
-            confidence[i] = (
-                np.mean([einsum_correlation(V[i].A, V[j].A.flatten(), type="pearson")[0, 0] for j in neigh_ids])
-                if issparse(V)
-                else np.mean(
-                    [einsum_correlation(V[i][None, :], V[j].flatten(), type="pearson")[0, 0] for j in neigh_ids]
-                )
-            )
+        confidence = neighbor_correlation(V, indices, type="pearson" if method == "correlation" else method)
 
     elif method == "divergence":
         pass
@@ -220,7 +177,9 @@ def jaccard(
         X_neighbors: the neighbor matrix.
 
     Returns:
-        The cell wise velocity confidence metric.
+        A tuple (jaccard, intersect_, union_) where `jaccard` is the cell wise velocity confidence metric, `intersect_`
+        is the graph of the neighbors shared by the two sets and `union_` is the size of the union of the two sets of
+        each cell.
     """
     from sklearn.decomposition import TruncatedSVD
 
@@ -239,10 +198,16 @@ def jaccard(
         X_neighbors.dot(X_neighbors),
         V_neighbors.dot(V_neighbors),
     )
-    union_ = X_neighbors_ + V_neighbors_ > 0
     intersect_ = mnn_from_list([X_neighbors_, V_neighbors_]) > 0
 
-    jaccard = (intersect_.sum(1) / union_.sum(1)).A1 if issparse(X) else intersect_.sum(1) / union_.sum(1)
+    # the size of the union is |A| + |B| - |A & B|, so the two neighbor graphs never need to be added up
+    for G in (X_neighbors_, V_neighbors_):
+        if issparse(G):
+            G.eliminate_zeros()
+    n_x, n_v = [G.getnnz(axis=1) if issparse(G) else np.count_nonzero(G, axis=1) for G in (X_neighbors_, V_neighbors_)]
+    n_intersect = np.asarray(intersect_.sum(1)).ravel()
+    union_ = n_x + n_v - n_intersect
+    jaccard = n_intersect / union_
 
     return jaccard, intersect_, union_
 
@@ -265,6 +230,52 @@ def consensus(x: np.ndarray, y: np.ndarray) -> np.ndarray:
     return consensus
 
 
+def neighbor_correlation(
+    V: Union[np.ndarray, csr_matrix],
+    indices: np.ndarray,
+    type: Literal["cosine", "pearson", "consensus"] = "pearson",
+    max_elements: int = 2**24,
+) -> np.ndarray:
+    """Calculate the mean correlation between the velocity vector of each cell and those of its nearest neighbors.
+
+    The cells are processed in blocks whose neighbor velocities are gathered into a dense cells x neighbors x genes
+    array, so that all correlations of a block are computed with one einsum instead of one `einsum_correlation` or
+    `consensus` call per pair of cells.
+
+    Args:
+        V: the RNA velocity of single cells (cells x genes).
+        indices: the indices of the nearest neighbors of each cell (cells x neighbors).
+        type: the type of correlation, either "cosine", "pearson" or "consensus" (cosine similarity scaled by the ratio
+            of the smaller to the larger velocity norm). Defaults to "pearson".
+        max_elements: the maximal number of entries of the dense neighbor velocities of a block. Defaults to 2**24.
+
+    Returns:
+        The mean correlation of each cell with its neighbors.
+    """
+    indices = np.asarray(indices)
+    (n_obs, n_var), n_neigh = V.shape, indices.shape[1]
+    step = max(1, max_elements // max(1, n_neigh * n_var))
+    confidence = np.zeros(n_obs)
+    for start in range(0, n_obs, step):
+        stop = min(start + step, n_obs)
+        x, y = V[start:stop], V[indices[start:stop].flatten()]
+        x = x.toarray() if issparse(x) else np.array(x, dtype=float)
+        y = (y.toarray() if issparse(y) else np.array(y, dtype=float)).reshape(stop - start, n_neigh, n_var)
+        if type == "pearson":
+            x -= x.mean(1)[:, None]
+            y -= y.mean(2)[:, :, None]
+
+        x_norm, y_norm = np.linalg.norm(x, axis=1)[:, None], np.linalg.norm(y, axis=2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # a neighbor without velocity is uncorrelated, the same as in `einsum_correlation`
+            corr = np.where(y_norm == 0, 0, np.einsum("ij,ikj->ik", x, y) / (x_norm * y_norm))
+            if type == "consensus":
+                corr = corr * np.minimum(x_norm, y_norm) / np.maximum(x_norm, y_norm)
+        confidence[start:stop] = corr.mean(1)
+
+    return confidence
+
+
 def gene_wise_confidence(
     adata: AnnData,
     group: str,
@@ -12,7 +12,7 @@ from ..preprocessing.normalization import normalize_mat_monocle, sz_util
 from ..preprocessing.pca import pca
 from ..utils import copy_adata
 from .connectivity import mnn, normalize_knn_graph, umap_conn_indices_dist_embedding
-from .utils import elem_prod, get_mapper, inverse_norm
+from .utils import elem_prod, get_mapper, group_by_time, inverse_norm
 
 
 # ---------------------------------------------------------------------------------------------------
@@ -1180,19 +1180,24 @@ def calc_12_mom_labeling(
         if `calculate_2_mom` is true, and `t_uniq` is the unique time stamps.
     """
 
-    t_uniq = np.unique(t)
+    t_uniq, groups = group_by_time(t)
 
-    m = np.zeros((data.shape[0], len(t_uniq)))
+    n_genes = data.shape[0]
+    m = np.zeros((n_genes, len(t_uniq)))
     if calculate_2_mom:
-        v = np.zeros((data.shape[0], len(t_uniq)))
-
-    for i in range(data.shape[0]):
-        data_ = (
-            np.array(data[i].A.flatten(), dtype=float) if issparse(data) else np.array(data[i], dtype=float)
-        )  # consider using the `adata.obs_vector`, `adata.var_vector` methods or accessing the array directly.
-        m[i] = strat_mom(data_, t, np.nanmean)
-        if calculate_2_mom:
-            v[i] = strat_mom(data_, t, np.nanvar)
+        v = np.zeros((n_genes, len(t_uniq)))
+
+    # the moments of a block of genes are computed at once for each time point, densifying one block of a sparse
+    # matrix at a time instead of one gene at a time.
+    data = data.tocsr() if issparse(data) else data
+    step = max(1, 2**22 // max(1, data.shape[1]))
+    for start in range(0, n_genes, step):
+        block = data[start : start + step]
+        block = np.asarray(block.toarray() if issparse(block) else block, dtype=float)
+        for i, cells in enumerate(groups):
+            m[start : start + step, i] = np.nanmean(block[:, cells], 1)
+            if calculate_2_mom:
+                v[start : start + step, i] = np.nanvar(block[:, cells], 1)
 
     return (m, v, t_uniq) if calculate_2_mom else (m, t_uniq)
 
@@ -1068,6 +1068,22 @@ def compute_velocity_labeling_B(B, alpha, R):
     return alpha - elem_prod(B, R.T).T
 
 
+def group_by_time(t: np.ndarray) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Group the cells by their time points with one sort, instead of one full scan of `t` per time point.
+
+    Args:
+        t: the time point of each cell.
+
+    Returns:
+        A tuple (t_uniq, groups) where `t_uniq` is the sorted unique time points and `groups` is a list of index arrays,
+        the i-th of which contains the cells measured at `t_uniq[i]`.
+    """
+    t = np.asarray(t)
+    order = np.argsort(t, kind="stable")
+    t_uniq, starts = np.unique(t[order], return_index=True)
+    return t_uniq, np.split(order, starts[1:])
+
+
 # ---------------------------------------------------------------------------------------------------
 # dynamics related:
 def remove_2nd_moments(adata: AnnData) -> None:
@@ -2170,6 +2186,25 @@ def find_extreme(s, u, normalize=True, perc_left=None, perc_right=None):
     return mask
 
 
+def find_extreme_batch(s, u, normalize=True, perc_left=None, perc_right=None):
+    """Row-wise version of `find_extreme` for dense genes x cells matrices: each row is thresholded independently."""
+    if normalize:
+        su = s / np.clip(np.max(s, axis=1, keepdims=True), 1e-3, None)
+        su += u / np.clip(np.max(u, axis=1, keepdims=True), 1e-3, None)
+    else:
+        su = s + u
+
+    if perc_left is None:
+        mask = su >= np.percentile(su, 100 - perc_right, axis=1, keepdims=True)
+    elif perc_right is None:
+        mask = np.ones_like(su, dtype=bool)
+    else:
+        left, right = np.percentile(su, [perc_left, 100 - perc_right], axis=1, keepdims=True)
+        mask = (su <= left) | (su >= right)
+
+    return mask
+
+
 def get_group_params_indices(adata, param_name):
     return adata.var.columns.str.endswith(param_name)
 
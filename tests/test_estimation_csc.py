@@ -0,0 +1,346 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, issparse
+
+from dynamo.estimation.csc.utils_velocity import (
+    calc_R2_loglikelihood_batch,
+    csr_row_sums,
+    fit_alpha_degradation,
+    fit_alpha_degradation_batch,
+    fit_alpha_synthesis,
+    fit_alpha_synthesis_batch,
+    fit_first_order_deg_lsq,
+    fit_first_order_deg_lsq_batch,
+    fit_gamma_lsq,
+    fit_gamma_lsq_batch,
+    fit_linreg,
+    row_means,
+    sol_s,
+    solve_alpha_2p,
+    solve_alpha_2p_batch,
+    solve_gamma,
+    solve_gamma_mean,
+    steady_state_linreg,
+    steady_state_linreg_batch,
+)
+from dynamo.estimation.csc.velocity import Velocity, ss_estimation
+from dynamo.tools.utils import calc_norm_loglikelihood, calc_R2, find_extreme
+
+
+def steady_state_data(n_genes=20, n_cells=200, seed=0):
+    rng = np.random.default_rng(seed)
+    S = rng.gamma(2, 2, size=(n_genes, n_cells))
+    U = S * rng.uniform(0.2, 2, size=(n_genes, 1)) + rng.normal(0, 0.5, size=(n_genes, n_cells)).clip(0)
+    return U, S
+
+
+def degradation_data(n_genes=20, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.array([0, 1, 2, 4, 8], dtype=float)
+    beta, l0 = rng.uniform(0.1, 1, n_genes), rng.uniform(1, 50, n_genes)
+    L = l0[:, None] * np.exp(-beta[:, None] * t) * rng.uniform(0.9, 1.1, size=(n_genes, len(t)))
+    return t, L, beta
+
+
+def test_fit_gamma_steady_state_batch():
+    U, S = steady_state_data()
+    est = ss_estimation(U=U, S=S, model="deterministic", est_method="ols", experiment_type="conventional")
+
+    for intercept in [False, True]:
+        res = est.fit_gamma_steady_state_batch(csr_matrix(U), csr_matrix(S), intercept, None, 5)
+        for i in range(U.shape[0]):
+            assert np.allclose([r[i] for r in res], est.fit_gamma_steady_state(U[i], S[i], intercept, None, 5))
+
+
+def test_steady_state_linreg():
+    U, S = steady_state_data()
+
+    for intercept, perc_left in [(False, None), (True, 5)]:
+        left = -1.0 if perc_left is None else float(perc_left)
+        res = steady_state_linreg_batch(S, U, left, 5.0, True, intercept)
+        for i in range(U.shape[0]):
+            mask = find_extreme(S[i], U[i], perc_left=perc_left, perc_right=5)
+            k, b, r2, all_r2 = fit_linreg(S[i], U[i], mask, intercept)
+            logLL, all_logLL = (
+                calc_norm_loglikelihood(S[i][mask], U[i][mask], k),
+                calc_norm_loglikelihood(S[i], U[i], k),
+            )
+            expected = (k, b, r2, all_r2, logLL, all_logLL)
+            assert np.allclose(steady_state_linreg(S[i], U[i], left, 5.0, True, intercept), expected)
+            assert np.allclose(res[:, i], expected)
+
+
+def test_fit_gamma_stochastic_batch():
+    U, S = steady_state_data()
+    US, SS = U * S, S * S
+    est = ss_estimation(U=U, S=S, model="stochastic", est_method="gmm", experiment_type="conventional")
+
+    for data in [(U, S, US, SS), [csr_matrix(X) for X in (U, S, US, SS)]]:
+        res = est.fit_gamma_stochastic_batch("gmm", *data, perc_left=None, perc_right=5)
+        for i in range(U.shape[0]):
+            expected = est.fit_gamma_stochastic("gmm", U[i], S[i], US[i], SS[i], perc_left=None, perc_right=5)
+            assert np.allclose([r[i] for r in res[:6]], expected[:6])
+
+
+def test_csr_row_sums():
+    X = np.random.default_rng(0).random((6, 8)) * (np.arange(6) % 2)[:, None]
+    X[X < 0.3] = 0
+    assert np.allclose(csr_row_sums(csr_matrix(X)), X.sum(1))
+
+
+def test_solve_gamma_mean():
+    U, S = steady_state_data()
+    expected = [solve_gamma(2.0, U[i], U[i] + S[i]) for i in range(U.shape[0])]
+    for X, Y in [(U, S), (csr_matrix(U), csr_matrix(S))]:
+        assert np.allclose(solve_gamma_mean(2.0, row_means(X), row_means(X) + row_means(Y)), expected)
+
+
+def test_fit_degradation_batch():
+    t, L, beta = degradation_data()
+
+    beta_est, l0_est = fit_first_order_deg_lsq_batch(t, L)
+    for i in range(L.shape[0]):
+        assert np.allclose([beta_est[i], l0_est[i]], fit_first_order_deg_lsq(t, L[i]), rtol=1e-3)
+
+    gamma = np.random.default_rng(1).uniform(0.05, 1, L.shape[0])
+    S = np.array([sol_s(t, 2 * L[i, 0], L[i, 0], 0, beta[i], gamma[i]) for i in range(L.shape[0])])
+    gamma_est, s0_est = fit_gamma_lsq_batch(t, S, beta_est, l0_est)
+    for i in range(L.shape[0]):
+        assert np.allclose([gamma_est[i], s0_est[i]], fit_gamma_lsq(t, S[i], beta_est[i], l0_est[i]), rtol=1e-3)
+
+    alpha, u0, r2 = fit_alpha_degradation_batch(t, L, beta, intercept=True)
+    for i in range(L.shape[0]):
+        assert np.allclose([alpha[i], u0[i], r2[i]], fit_alpha_degradation(t, L[i], beta[i], intercept=True), atol=1e-6)
+
+    alpha = fit_alpha_synthesis_batch(t[1:], L[:, 1:], beta)
+    for i in range(L.shape[0]):
+        assert np.isclose(alpha[i], fit_alpha_synthesis(t[1:], L[i, 1:], beta[i]))
+
+
+def test_vel_u_time_dependent_alpha():
+    U, _ = steady_state_data(n_genes=5, n_cells=12)
+    t = np.repeat([1.0, 2.0, 4.0], 4)
+    alpha, beta = np.random.default_rng(0).random((5, 3)), np.random.default_rng(1).random(5)
+    expected = np.repeat(alpha, 4, axis=1) - beta[:, None] * U
+
+    for X in [U, csr_matrix(U)]:
+        vel = Velocity(alpha=alpha, beta=beta, t=t)
+        V = vel.vel_u(X)
+        assert np.allclose(V.A if issparse(V) else V, expected)
+
+
+def test_vel_s_time_dependent_gamma():
+    U, S = steady_state_data(n_genes=5, n_cells=12)
+    t = np.repeat([1.0, 2.0, 4.0], 4)
+    beta, gamma = np.random.default_rng(0).random(5), np.random.default_rng(1).random((5, 3))
+    expected = beta[:, None] * U - np.repeat(gamma, 4, axis=1) * S
+
+    for X, Y in [(U, S), (csr_matrix(U), csr_matrix(S))]:
+        vel = Velocity(beta=beta, gamma=gamma, t=t)
+        V = vel.vel_s(X, Y)
+        assert np.allclose(V.A if hasattr(V, "A") else V, expected)
+
+
+def test_vel_s_mixed_formats():
+    U, S = steady_state_data(n_genes=5, n_cells=12)
+    rng = np.random.default_rng(0)
+    beta, gamma = rng.random(5), rng.random(5)
+    expected = Velocity(beta=beta, gamma=gamma).vel_s(U, S)
+
+    for X, Y in [(csr_matrix(U), S), (U, csr_matrix(S))]:
+        V = Velocity(beta=beta, gamma=gamma).vel_s(X, Y)
+        assert np.allclose(V.A if hasattr(V, "A") else V, expected)
+
+
+def test_ind_for_proteins_resolved_to_int_rows():
+    U, S = steady_state_data(n_genes=6, n_cells=10)
+    mask = np.array([True, False, True, False, False, True])
+    est = ss_estimation(U=U, S=S, ind_for_proteins=mask)
+    assert np.array_equal(est.ind_for_proteins, [0, 2, 5])
+
+    est.ind_for_proteins = [1, 3]
+    assert est.ind_for_proteins.dtype.kind == "i" and np.array_equal(est.ind_for_proteins, [1, 3])
+
+
+def test_velocity_out_buffer():
+    U, S = steady_state_data(n_genes=5, n_cells=12)
+    t = np.repeat([1.0, 2.0, 4.0], 4)
+    beta, gamma = np.random.default_rng(0).random(5), np.random.default_rng(1).random((5, 3))
+    vel = Velocity(beta=beta, gamma=gamma, t=t)
+
+    out = np.empty(U.shape)
+    V = vel.vel_s(U, S, out=out)
+    assert V is out and np.allclose(out, beta[:, None] * U - np.repeat(gamma, 4, axis=1) * S)
+
+    # the time point expansion buffers are reused but never handed out
+    V2 = vel.vel_s(U, 2 * S)
+    assert V2 is not out and np.allclose(out, V)
+
+
+def test_velocity_out_buffer_rejected():
+    U, S = steady_state_data(n_genes=5, n_cells=12)
+    rng = np.random.default_rng(0)
+    vel = Velocity(alpha=rng.random((5, 12)), beta=rng.random(5), gamma=rng.random(5))
+
+    for out in [np.empty((5, 11)), np.empty(U.shape, dtype=np.float32), np.empty(U.shape, order="F")]:
+        with pytest.raises(ValueError):
+            vel.vel_u(U, update_alpha=False, out=out)
+        with pytest.raises(ValueError):
+            vel.vel_s(U, S, out=out)
+
+
+def test_fused_velocity_kernels():
+    U, S = steady_state_data(n_genes=5, n_cells=12)
+    rng = np.random.default_rng(0)
+    alpha, gamma, eta, delta = rng.random((5, 1)), rng.random(5), rng.random(5), rng.random(5)
+
+    vel = Velocity(alpha=alpha, gamma=gamma)
+    assert np.allclose(vel.vel_s(U, S), alpha - gamma[:, None] * S)
+    assert np.allclose(vel.vel_u(U, repeat=True), alpha - gamma[:, None] * U)
+    assert vel.parameters["beta"] is None
+
+    vel = Velocity(eta=eta, delta=delta)
+    assert np.allclose(vel.vel_p(S, U), eta[:, None] * S - delta[:, None] * U)
+
+
+def test_velocity_float32():
+    U, S = steady_state_data(n_genes=5, n_cells=12)
+    rng = np.random.default_rng(0)
+    alpha, beta, gamma = rng.random((5, 12)), rng.random(5), rng.random(5)
+    vel64 = Velocity(alpha=alpha, beta=beta, gamma=gamma)
+    vel32 = Velocity(alpha=alpha, beta=beta, gamma=gamma, dtype=np.float32)
+
+    for X, Y in [(U, S), (csr_matrix(U), csr_matrix(S))]:
+        for V64, V32 in [
+            (vel64.vel_u(X, update_alpha=False), vel32.vel_u(X, update_alpha=False)),
+            (vel64.vel_s(X, Y), vel32.vel_s(X, Y)),
+        ]:
+            assert V32.dtype == np.float32
+            assert np.allclose(V32.A if hasattr(V32, "A") else V32, V64.A if hasattr(V64, "A") else V64, rtol=1e-5)
+
+
+def test_velocity_cupy_backend():
+    pytest.importorskip("cupy")
+    U, S = steady_state_data(n_genes=5, n_cells=12)
+    rng = np.random.default_rng(0)
+    alpha, beta, gamma, eta, delta = rng.random((5, 12)), rng.random(5), rng.random(5), rng.random(5), rng.random(5)
+    params = dict(alpha=alpha, beta=beta, gamma=gamma, eta=eta, delta=delta)
+    vel, vel_gpu = Velocity(**params), Velocity(**params, backend="cupy")
+
+    def to_host(V):
+        V = V.get() if hasattr(V, "get") else V
+        return V.A if hasattr(V, "A") else V
+
+    for X, Y in [(U, S), (csr_matrix(U), csr_matrix(S))]:
+        for V, V_gpu in [
+            (vel.vel_u(X, update_alpha=False), vel_gpu.vel_u(X, update_alpha=False)),
+            (vel.vel_s(X, Y), vel_gpu.vel_s(X, Y)),
+            (vel.vel_p(Y, X), vel_gpu.vel_p(Y, X)),
+        ]:
+            assert np.allclose(to_host(V), to_host(V_gpu))
+
+    assert len(vel_gpu._device_inputs) > 0
+    vel_gpu.clear_device_cache()
+    assert len(vel_gpu._device_inputs) == 0
+
+
+def test_velocity_expansion_cache():
+    U, S = steady_state_data(n_genes=5, n_cells=12)
+    t = np.repeat([1.0, 2.0, 4.0], 4)
+    rng = np.random.default_rng(0)
+    beta, gamma = rng.random(5), rng.random((5, 3))
+    vel = Velocity(beta=beta, gamma=gamma, t=t)
+
+    V = vel.vel_s(U, S)
+    expanded = vel._expanded["gamma"][2]
+    assert np.allclose(vel.vel_s(U, S), V) and vel._expanded["gamma"][2] is expanded
+
+    # reassigning the parameter invalidates its expansion
+    vel.parameters["gamma"] = 2 * gamma
+    assert np.allclose(vel.vel_s(U, S), beta[:, None] * U - np.repeat(2 * gamma, 4, axis=1) * S)
+
+
+def test_vel_u_sparse_scatter():
+    U, _ = steady_state_data(n_genes=5, n_cells=12)
+    U[U < 3] = 0
+    rng = np.random.default_rng(0)
+    beta = rng.random(5)
+
+    for alpha in [rng.random((5, 1)), rng.random((5, 12))]:
+        vel = Velocity(alpha=alpha, beta=beta)
+        V = vel.vel_u(csr_matrix(U), repeat=True, update_alpha=False)
+        assert issparse(V) and V.format == "csr" and np.allclose(V.A, alpha - beta[:, None] * U)
+
+        # a dense out buffer is the explicit request for a dense velocity
+        out = np.empty(U.shape)
+        V = vel.vel_u(csr_matrix(U), repeat=True, update_alpha=False, out=out)
+        assert V is out and np.allclose(V, alpha - beta[:, None] * U)
+
+        vel = Velocity(alpha=alpha, gamma=beta)
+        V = vel.vel_s(csr_matrix(U), csr_matrix(U))
+        assert issparse(V) and V.format == "csr" and np.allclose(V.A, alpha - beta[:, None] * U)
+
+
+def test_vel_u_stores_cell_wise_alpha():
+    U, _ = steady_state_data(n_genes=5, n_cells=7)
+    rng = np.random.default_rng(0)
+    alpha, beta = rng.random(5), rng.random(5)
+
+    for X in [U, csr_matrix(U)]:
+        vel = Velocity(alpha=alpha, beta=beta)
+        vel.vel_u(X, repeat=True)
+        assert vel.parameters["alpha"].shape == (5, 7) and vel.get_n_cells() == 7
+        assert np.allclose(vel.parameters["alpha"], np.repeat(alpha[:, None], 7, axis=1))
+
+
+def test_fit_delta_steady_state():
+    U, S = steady_state_data(n_genes=6, n_cells=50)
+    P = np.random.default_rng(1).gamma(2, 2, size=(2, 50))
+    ind_for_proteins = np.array([1, 4])
+
+    for f in [np.asarray, np.asfortranarray, csr_matrix]:
+        est = ss_estimation(U=f(U), S=f(S), P=f(P), ind_for_proteins=ind_for_proteins, est_method="ols")
+        est.fit()
+        for i, j in enumerate(ind_for_proteins):
+            expected = est.fit_gamma_steady_state(S[j], P[i], False, None, 5)
+            assert np.allclose([est.parameters["delta"][i], est.aux_param["delta_r2"][i]], expected[::3][:2])
+
+
+def test_fit_alpha_oneshot():
+    U, _ = steady_state_data(n_genes=5, n_cells=12)
+    t = np.repeat([1.0, 2.0, 4.0], 4)
+    beta = np.random.default_rng(0).random(5)
+    est = ss_estimation(U=U)
+
+    for clusters in [None, [[0, 1, 5], [], list(range(6, 12))]]:
+        groups = [[i] for i in range(12)] if clusters is None else clusters
+        expected = np.array(
+            [[fit_alpha_synthesis(t, U[j][c], beta[j]) if len(c) > 0 else np.nan for c in groups] for j in range(5)]
+        )
+        for X in [U, csr_matrix(U)]:
+            assert np.allclose(est.fit_alpha_oneshot(t, X, beta, clusters), expected, equal_nan=True)
+
+
+def test_solve_alpha_2p_batch():
+    rng = np.random.default_rng(0)
+    t = np.array([1.0, 2.0, 4.0])
+    alpha0, beta, u1 = rng.random(5), rng.random(5), rng.random((5, 3))
+    alpha1 = solve_alpha_2p_batch(4 - t, t, alpha0, beta, u1)
+    for i in range(5):
+        for j in range(3):
+            assert np.isclose(alpha1[i, j], solve_alpha_2p(4 - t[j], t[j], alpha0[i], beta[i], u1[i, j]))
+
+
+def test_calc_R2_loglikelihood_batch():
+    U, S = steady_state_data()
+    rng = np.random.default_rng(1)
+    k, b, mask = rng.uniform(0.2, 2, U.shape[0]), rng.normal(size=U.shape[0]), rng.random(U.shape) > 0.3
+
+    r2, logLL = calc_R2_loglikelihood_batch(S, U, k, mask, b)
+    all_r2, all_logLL = calc_R2_loglikelihood_batch(S, U, k)
+    for i in range(U.shape[0]):
+        m = mask[i]
+        assert np.isclose(r2[i], calc_R2(S[i][m], U[i][m], k[i], f=lambda X, k: k * X + b[i]))
+        assert np.isclose(logLL[i], calc_norm_loglikelihood(S[i][m], U[i][m], k[i]))
+        assert np.isclose(all_r2[i], calc_R2(S[i], U[i], k[i]))
+        assert np.isclose(all_logLL[i], calc_norm_loglikelihood(S[i], U[i], k[i]))
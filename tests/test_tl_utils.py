@@ -1,6 +1,10 @@
 import numpy as np
+from scipy.sparse import csr_matrix
 
 import dynamo
+from dynamo.tools.metric_velocity import consensus, neighbor_correlation
+from dynamo.tools.moments import calc_12_mom_labeling, strat_mom
+from dynamo.tools.utils import einsum_correlation
 
 
 def smallest_distance_bf(coords):
@@ -34,6 +38,41 @@ def test_smallest_distance_simple_random():
     assert abs(smallest_distance_bf(coords) - dynamo.tl.compute_smallest_distance(coords)) < 1e-8
 
 
+def test_neighbor_correlation():
+    rng = np.random.default_rng(0)
+    V = rng.normal(size=(30, 8))
+    V[3] = 0
+    indices = np.array([rng.choice(30, 5, replace=False) for _ in range(30)])
+
+    for type in ["cosine", "pearson"]:
+        expected = [
+            np.mean([einsum_correlation(V[i][None, :].copy(), V[j].copy(), type=type).ravel()[0] for j in indices[i]])
+            for i in range(30)
+        ]
+        for X in [V, csr_matrix(V)]:
+            assert np.allclose(neighbor_correlation(X, indices, type=type, max_elements=64), expected, equal_nan=True)
+
+    V[3] = 1
+    expected = [np.mean([consensus(V[i].copy(), V[j].copy()) for j in indices[i]]) for i in range(30)]
+    assert np.allclose(neighbor_correlation(V, indices, type="consensus"), expected)
+
+
+def test_calc_12_mom_labeling():
+    rng = np.random.default_rng(0)
+    X = rng.random((20, 30))
+    X[X < 0.5] = 0
+    t = rng.choice([1.0, 2.0, 4.0], 30)
+
+    for data in [X, csr_matrix(X)]:
+        m, v, t_uniq = calc_12_mom_labeling(data, t)
+        assert np.array_equal(t_uniq, [1.0, 2.0, 4.0])
+        for i in range(X.shape[0]):
+            assert np.allclose(m[i], strat_mom(X[i], t, np.nanmean))
+            assert np.allclose(v[i], strat_mom(X[i], t, np.nanvar))
+
+
 if __name__ == "__main__":
     test_smallest_distance_simple_1()
     test_smallest_distance_simple_random()
+    test_neighbor_correlation()
+    test_calc_12_mom_labeling()